@@ -0,0 +1,219 @@
+# ruff: noqa: E501
+import asyncio
+import heapq
+from collections import deque
+from .factory import DataFactory
+from .load import parse_duration
+from .metrics import LatencyRecorder
+from .pool import http_pool
+from .payloads import registry
+from .sink import metrics_sink
+from .users import mint_user
+
+PROFILE_OPTIONS = ('users', 'duration', 'steps', 'step', 'p99', 'max_error_rate', 'drain')
+
+
+class ArrivalProfile:
+    """
+    Parsed value of the `--open_loop` option, e.g. `sendTextMessage=200,markAsRead=50,duration=30s,steps=5,step=1.5`.
+
+    <operation>=<rate>: operations of resources/gql_payload fired at `rate` per second (first step);
+    users: virtual users the operations are spread over, paired two by two in conversations;
+    duration: duration of every step;
+    steps: maximum number of steps, the rates of each step being `step` times the previous ones;
+    p99: 99th percentile of the latency from the intended send time above which a step is saturated;
+    max_error_rate: share of failed operations above which a step is saturated;
+    drain: time given to the operations still in flight at the end of a step, then counted as errors.
+    """
+
+    def __init__(self, rates, users=20, duration=30.0, steps=5, step=1.5, p99=1.0, max_error_rate=0.01, drain=10.0):
+        self.rates = rates
+        self.users = users + users % 2
+        self.duration = duration
+        self.steps = steps
+        self.step = step
+        self.p99 = p99
+        self.max_error_rate = max_error_rate
+        self.drain = drain
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        rates = {operation: float(rate.removesuffix('/s')) for operation, rate in options.items()
+                 if operation not in PROFILE_OPTIONS}
+        unknown = set(rates) - set(OPERATION_PARAMS)
+        if unknown or not rates:
+            raise ValueError(f"Unknown open-loop operations: {sorted(unknown)}, supported: {sorted(OPERATION_PARAMS)}")
+        return cls(rates,
+                   users=int(options.get('users', 20)),
+                   duration=parse_duration(options.get('duration', '30s')),
+                   steps=int(options.get('steps', 5)),
+                   step=float(options.get('step', 1.5)),
+                   p99=parse_duration(options.get('p99', '1s')),
+                   max_error_rate=float(options.get('max_error_rate', 0.01)),
+                   drain=parse_duration(options.get('drain', '10s')))
+
+
+class VirtualUser:
+
+    def __init__(self, user, conversation_id):
+        self.user = user
+        self.partner = None
+        self.conversation_id = conversation_id
+        # ids of the messages of the partner not marked as read yet
+        self.inbox = deque()
+        self.last_message_id = None
+
+
+def _mark_as_read(vu):
+    message_id = vu.inbox.popleft() if vu.inbox else vu.last_message_id
+    return None if message_id is None else {"message_id": message_id}
+
+
+# operations the scheduler can fire, with the variables of an execution by a virtual user (None: skipped)
+OPERATION_PARAMS = {
+    'sendTextMessage': lambda vu: {"conversation_id": vu.conversation_id, "message": f"Open-loop message from {vu.user['uuid']}"},
+    'markAsRead': _mark_as_read,
+    'lastSeen': lambda vu: {},
+    'userMeta': lambda vu: {},
+    'conversations': lambda vu: {"tagsFilter": "-"},
+    'unreadMessages': lambda vu: {"conversation_id": vu.conversation_id},
+    'messagesByConversation': lambda vu: {"conversation_id": vu.conversation_id},
+}
+
+
+class OpenLoopScheduler:
+    """
+    Fires operations at constant arrival rates on a fixed timetable, whatever the responses (open loop).
+
+    Execution `i` of an operation at `rate` per second is due `i / rate` seconds after the start of the
+    step; it is sent on the async HTTP transport on behalf of the virtual users in turn. Its latency is
+    measured from that intended send time, so that the time spent waiting behind a slow server or a late
+    client counts (coordinated-omission correction); the latency from the actual send time is kept apart.
+
+    The rates are multiplied by `step` after every step, until a step is saturated: the completed
+    throughput is below 90% of the target rate (the operations skipped for want of parameters aside, they
+    are reported apart), the corrected p99 is above `p99` or the errors above `max_error_rate`. The
+    capacity is the last sustained total rate.
+    """
+
+    def __init__(self, env_config, profile):
+        self.env_config = env_config
+        self.profile = profile
+        self.virtual_users = []
+        self.steps = []
+        self._skipped = {}
+        self._completed = 0
+        self._deadline = None
+
+    def prepare(self):
+        users = [mint_user(self.env_config.jwt_key, prefix=f'user-conspector-ol{i}') for i in range(self.profile.users)]
+        factory = DataFactory(self.env_config)
+        conversations = [factory.create_conversations(users[i], [users[i + 1]['uuid']])[0]
+                         for i in range(0, len(users), 2)]
+        for i, user in enumerate(users):
+            conversation_id = conversations[i // 2]['createConversation']['conversation']['id']
+            self.virtual_users.append(VirtualUser(user, conversation_id))
+        for i, vu in enumerate(self.virtual_users):
+            vu.partner = self.virtual_users[i ^ 1]
+        return self
+
+    async def _fire(self, operation, vu, intended, corrected, service):
+        params = OPERATION_PARAMS[operation](vu)
+        if params is None:
+            # e.g. 'markAsRead' before the partner has sent any message: not an error of the server
+            self._skipped[operation] = self._skipped.get(operation, 0) + 1
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            session = await http_pool.session(self.env_config.graphql_endpoint, vu.user, self.env_config.gql_headers)
+            async with http_pool.slot:
+                sent = loop.time()
+                result = await session.execute(registry[operation], variable_values=params or None)
+        except Exception:
+            corrected.error(operation)
+            metrics_sink.operation(operation, vu.user['uuid'], round((loop.time() - intended) * 1000, 3), 'error')
+            return
+        end = loop.time()
+        if end <= self._deadline:
+            self._completed += 1
+        corrected.record(operation, (end - intended) * 1000)
+        service.record(operation, (end - sent) * 1000)
+        # latency from the intended send time, as the scheduler measures it
+        metrics_sink.operation(operation, vu.user['uuid'], round((end - intended) * 1000, 3), service=round((end - sent) * 1000, 3))
+        if operation == 'sendTextMessage':
+            vu.partner.inbox.append(result['sendTextMessage']['message']['id'])
+            vu.partner.last_message_id = vu.partner.inbox[-1]
+
+    async def run_step(self, rates):
+        loop = asyncio.get_running_loop()
+        corrected, service = LatencyRecorder(), LatencyRecorder()
+        start = loop.time() + 0.1
+        # timetable: (intended send time, operation, index), merged over the operations
+        timetable = [(start, operation, 0) for operation in rates]
+        heapq.heapify(timetable)
+        tasks = set()
+        self._skipped = {}
+        self._completed = 0
+        self._deadline = start + self.profile.duration
+        corrected.start()
+        while timetable:
+            intended, operation, i = heapq.heappop(timetable)
+            if intended - start >= self.profile.duration:
+                continue
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            vu = self.virtual_users[i % len(self.virtual_users)]
+            task = asyncio.ensure_future(self._fire(operation, vu, intended, corrected, service))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            heapq.heappush(timetable, (start + (i + 1) / rates[operation], operation, i + 1))
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.profile.drain)
+            for task in pending:
+                task.cancel()
+                corrected.error('timeout')
+        corrected.stop()
+        target = sum(rates.values())
+        # responses received within the step: the ones drained after it are the backlog of a saturated server
+        throughput = self._completed / self.profile.duration
+        # skipped operations are never sent: the throughput is compared to the rate actually sent
+        sent = target - sum(self._skipped.values()) / self.profile.duration
+        p99 = max((h.percentile(99) for h in corrected.histograms.values()), default=None)
+        error_rate = corrected.total_errors / corrected.total if corrected.total else 0.0
+        return {'rates': rates, 'target': target, 'throughput': throughput, 'p99': p99, 'error_rate': error_rate,
+                'corrected': corrected, 'service': service, 'skipped': self._skipped,
+                'saturated': throughput < 0.9 * sent or p99 is None or p99 > self.profile.p99 * 1000
+                or error_rate > self.profile.max_error_rate}
+
+    async def run(self):
+        rates = dict(self.profile.rates)
+        for _ in range(self.profile.steps):
+            step = await self.run_step(rates)
+            self.steps.append(step)
+            if step['saturated']:
+                break
+            rates = {operation: rate * self.profile.step for operation, rate in rates.items()}
+        return self
+
+    @property
+    def capacity(self):
+        """Highest total rate (operations/s) sustained by a step, None when the first step is saturated."""
+        sustained = [step['target'] for step in self.steps if not step['saturated']]
+        return max(sustained) if sustained else None
+
+    def report(self):
+        lines = []
+        for n, step in enumerate(self.steps, 1):
+            rates = ", ".join(f"{operation}: {round(rate, 1)}/s" for operation, rate in step['rates'].items())
+            lines.append(f"[INFO] step {n} ({rates}): {round(step['throughput'], 1)} of {round(step['target'], 1)} ops/s, "
+                         f"p99 from intended send {step['p99']} ms, errors {round(step['error_rate'] * 100, 2)}%, "
+                         f"skipped {sum(step['skipped'].values())}"
+                         f"{' SATURATED' if step['saturated'] else ''}")
+            for operation, histogram in sorted(step['corrected'].histograms.items()):
+                service = step['service'].histograms[operation]
+                lines.append(f"[INFO]   '{operation}': p50/p99 {histogram.percentile(50)}/{histogram.percentile(99)} ms "
+                             f"from intended send, {service.percentile(50)}/{service.percentile(99)} ms from actual send")
+        lines.append(f"[INFO] capacity: {self.capacity} ops/s" if self.capacity else "[INFO] capacity: below the first step")
+        return lines
@@ -0,0 +1,80 @@
+# ruff: noqa: E501
+import gzip
+import json
+import os
+import threading
+from timeit import default_timer as timer
+from .users import worker_path
+
+# error of the replay server for an operation absent from the cassette
+NO_RECORDED_RESPONSE = 'No recorded response for this operation'
+
+
+def load_cassette(path):
+    with gzip.open(worker_path(path), 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+class Cassette:
+    """
+    Traffic of a session recorded as gzip JSON lines (`--record`), one entry per:
+
+    - HTTP operation of `Queries.execute_gql`, `AsyncQueries.execute_http` and `PersistedQueryBenchmark`,
+      batch of `DataFactory`: request, response, elapsed time (ms);
+    - websocket frame sent or received by a pooled `AsyncQueries` connection;
+    - user minted by `create_users`, `seed_data` and `slo_conversation`, with its role.
+
+    `t` of every entry is its offset (s) from the start of the recording; the credentials
+    (JWTs, `connection_init` payloads) are not recorded.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.entries = []
+        self._start = None
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self):
+        return self.path is not None
+
+    def record(self, path):
+        self.path = worker_path(path)
+        self.entries = []
+        self._start = timer()
+
+    def _append(self, entry, at=None):
+        with self._lock:
+            entry['t'] = round((at or timer()) - self._start, 6)
+            self.entries.append(entry)
+
+    def user(self, uuid, role='session'):
+        """`role` of the user: 'session' (`create_users`), 'seed' or 'slo'."""
+        if self.recording:
+            self._append({'kind': 'user', 'uuid': uuid, 'role': role})
+
+    def http(self, operation, user, query, variables, response, elapsed, start):
+        if self.recording:
+            self._append({'kind': 'http', 'operation': operation, 'user': user, 'query': query,
+                          'variables': variables, 'response': response, 'elapsed': elapsed}, at=start)
+
+    def frame(self, connection, direction, message):
+        if not self.recording:
+            return
+        frame = json.loads(message)
+        if frame.get('type') == 'connection_init':
+            frame['payload'] = {}
+        self._append({'kind': 'ws', 'connection': connection, 'direction': direction, 'frame': frame})
+
+    def save(self):
+        if not self.recording:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with gzip.open(self.path, 'wt') as f:
+            for entry in sorted(self.entries, key=lambda e: e['t']):
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        print(f"[INFO] {len(self.entries)} interactions recorded in '{self.path}'")
+        self.path = None
+
+
+traffic = Cassette()
@@ -1,9 +1,17 @@
 import re
 import json
+from importlib.util import find_spec
+
+# secret of the JWTs minted for the local and replay servers when no `--jwt_key` is given
+LOCAL_JWT_KEY = 'local-server-secret-for-hermetic-runs'
+
+
+# values of `--compression`, negotiated with 'Accept-Encoding'
+COMPRESSIONS = ('identity', 'gzip', 'br')
 
 
 class Config:
-    def __init__(self, env, start_url, jwt_key):
+    def __init__(self, env, start_url, jwt_key, compression=None):
         start_url = re.search(r'(?:https?://)?(?:www\.)?([^/]+)(?=/|$)', start_url).group(1)
         self.start_url = start_url
 
@@ -15,11 +23,13 @@ class Config:
         else:
             self.env = env
 
-        prefix = 'http' if self.env == 'dev' else 'https'
-        ws_prefix = 'ws' if self.env == 'dev' else 'wss'
+        prefix = 'http' if self.env in ('dev', 'local', 'replay') else 'https'
+        ws_prefix = 'ws' if self.env in ('dev', 'local', 'replay') else 'wss'
         self.graphql_endpoint = f"{prefix}://{start_url}/graphql"
         self.wss_endpoint = f"{ws_prefix}://{start_url }/graphql-ws"
-        if jwt_key is None:
+        if jwt_key is None and self.env in ('local', 'replay'):
+            self.jwt_key = LOCAL_JWT_KEY
+        elif jwt_key is None:
             with open('access_keys.json') as f:
                 keys = json.load(f)
                 print(f"KEY: {keys.get('jwt_key')}")
@@ -32,6 +42,11 @@ class Config:
             'Country': 'fr',
             'User-Agent': 'SOS.ApiRequestTask/1.0'
         }
+        # decoded by urllib3 and aiohttp when one of the brotli packages is installed
+        if compression == 'br' and find_spec('brotli') is None and find_spec('brotlicffi') is None:
+            raise ValueError("'br' compression requires the 'brotli' package")
+        if compression is not None:
+            self.gql_headers['Accept-Encoding'] = compression
 
         self.api_headers = {
             "User-Agent": "SOS.ApiRequestTask/1.0",
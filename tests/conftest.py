@@ -1,8 +1,25 @@
-import jwt
-from datetime import datetime, timedelta
-from pytest import fixture
-from .config import Config
-from .queries import Queries
+import json
+import os
+from glob import glob
+from sys import argv
+from pytest import fixture, fail, hookimpl, Module, StashKey
+from .config import Config, COMPRESSIONS, LOCAL_JWT_KEY
+from .queries import Queries, correlator
+from .pool import client_pool, ws_pool, http_pool
+from .schema_cache import schema_cache
+from .payloads import registry
+from .users import mint_user, worker_path
+from .metrics import session_recorder
+from .local_server import LocalServer
+from .history import PerfHistory
+from .timing import request_timings
+from .factory import DataFactory, SeedProfile
+from .load import parse_duration
+from .cassette import traffic, load_cassette
+from .replay import PACINGS, ReplayServer
+from .profiling import PROFILERS, client_profiler
+from .selection import dependency_index
+from .sink import SINK_FILE, metrics_sink, summarize
 
 
 def pytest_addoption(parser):
@@ -22,38 +39,444 @@ def pytest_addoption(parser):
         action='store',
         help='JWT secret key for Auth tokens'
     )
+    parser.addoption(
+        '--compression',
+        action='store',
+        choices=COMPRESSIONS,
+        help="Content encoding negotiated for the HTTP responses, the client's default when not given"
+    )
+    parser.addoption(
+        '--persisted_queries',
+        action='store_true',
+        help='Send the HTTP operations as automatic persisted queries (sha256 hash of the document)'
+    )
+    parser.addoption(
+        '--local_latency',
+        action='store',
+        default='0ms',
+        help="Latency injected by the local server (`--env local`) in every operation and event, e.g. '20ms'"
+    )
+    parser.addoption(
+        '--local_jitter',
+        action='store',
+        default='0ms',
+        help="Random variation of the latency injected by the local server, e.g. '5ms'"
+    )
+    parser.addoption(
+        '--http_concurrency',
+        action='store',
+        type=int,
+        default=100,
+        help="Maximum number of operations in flight on the async HTTP transport ('AsyncQueries.execute_http')"
+    )
+    parser.addoption(
+        '--profile_client',
+        action='store',
+        nargs='?',
+        const='cprofile',
+        choices=PROFILERS,
+        help="Profile the client side of every test ('cprofile' by default, or 'sampling') in report/profiles, "
+             "and report its CPU time versus network wait per operation"
+    )
+    parser.addoption(
+        '--metrics_sink',
+        action='store',
+        nargs='?',
+        const=SINK_FILE,
+        help=f"Write the operations and subscription events as JSON lines in batches ('{SINK_FILE}' by default) "
+             "and summarize them at the end of the session"
+    )
+    parser.addoption(
+        '--log_sample',
+        action='store',
+        type=float,
+        help="Share of the human-readable lines of the tests printed: 1 by default, 0 with '--metrics_sink'"
+    )
+    parser.addoption(
+        '--incremental',
+        action='store_true',
+        help='Run only the tests affected by the payloads, fixtures and code changed since they last ran, '
+             'and the tests which failed or never ran (dependency index in report/test_index.json)'
+    )
+    parser.addoption(
+        '--refresh_schema',
+        action='store_true',
+        help='Re-introspect the GraphQL schema even if a cached copy is still valid'
+    )
+    parser.addoption(
+        '--load',
+        action='store',
+        help="Run the load mode only, e.g. 'users=500,duration=300s,ramp=30s,think=500ms'"
+    )
+    parser.addoption(
+        '--open_loop',
+        action='store',
+        help="Run the open-loop mode only: constant arrival rates stepped up to saturation, e.g. 'sendTextMessage=200,markAsRead=50,duration=30s,steps=5,step=1.5'"
+    )
+    parser.addoption(
+        '--soak',
+        action='store',
+        help="Run the soak mode only, e.g. 'users=50,duration=4h,window=5m,think=2s,heartbeat=30s'"
+    )
+    parser.addoption(
+        '--fanout',
+        action='store',
+        help="Run the subscription fan-out mode only, e.g. 'participants=1000,burst=10,timeout=60s'"
+    )
+    parser.addoption(
+        '--scaling',
+        action='store',
+        help="Run the data-volume scaling mode only, e.g. 'sizes=10/100/1000/10000,samples=20'"
+    )
+    parser.addoption(
+        '--record',
+        action='store',
+        help="Record the HTTP operations and websocket frames of the session in a cassette, e.g. 'report/cassettes/sandbox.jsonl.gz'"
+    )
+    parser.addoption(
+        '--replay',
+        action='store',
+        help='Run the suite against the traffic of a cassette served back by a local replay server'
+    )
+    parser.addoption(
+        '--replay_traffic',
+        action='store',
+        help='Run the traffic replay mode only: replay the HTTP operations of a cassette against the environment and compare their latency'
+    )
+    parser.addoption(
+        '--pacing',
+        action='store',
+        choices=PACINGS,
+        default='fast',
+        help="Pacing of '--replay' and '--replay_traffic': as fast as possible, or the recorded one"
+    )
+    parser.addoption(
+        '--seed',
+        action='store',
+        default='conversations=100,messages=10',
+        help="Volume of the bulk test data created by the 'seed_data' fixture, e.g. 'conversations=200,messages=10'"
+    )
+    parser.addoption(
+        '--regression_threshold',
+        action='store',
+        type=float,
+        default=0.2,
+        help='Relative slowdown of an operation median, compared to the previous runs, flagged as a regression'
+    )
+    parser.addoption(
+        '--fail_on_regression',
+        action='store_true',
+        help='Fail the session when a latency regression is detected'
+    )
+
+
+perf_env_key = StashKey[str]()
+
+# marker of the tests run only in a mode, and the option enabling the mode
+MODES = {
+    'load': '--load',
+    'open_loop': '--open_loop',
+    'soak': '--soak',
+    'fanout': '--fanout',
+    'scaling': '--scaling',
+    'replay': '--replay_traffic',
+}
+
+
+def pytest_collection_modifyitems(config, items):
+    enabled = {marker for marker, option in MODES.items() if config.getoption(option) is not None}
+
+    def is_selected(item):
+        modes = {marker for marker in MODES if item.get_closest_marker(marker) is not None}
+        return bool(modes & enabled) if enabled else not modes
+    selected = [item for item in items if is_selected(item)]
+    if config.getoption('--incremental'):
+        affected = [item for item in selected if dependency_index.affected(item.nodeid)]
+        changed = sorted({key for item in affected for key in dependency_index.changes(item.nodeid) or ()})
+        print(f"[INFO] incremental run: {len(affected)} of {len(selected)} tests affected"
+              f"{' by ' + ', '.join(changed) if changed else ''}")
+        selected = affected
+    if len(selected) != len(items):
+        config.hook.pytest_deselected(items=[item for item in items if item not in selected])
+        items[:] = selected
+
+
+class DependencyTracking:
+    """
+    Resources read by the setup of every fixture and by the import of every test module. Registered as a
+    plugin: the hooks of this conftest.py are not called for the session-scoped fixtures, set up on the
+    session node above the tests directory.
+    """
+
+    @hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        with dependency_index.tracking(f"fixture:{fixturedef.argname}"):
+            yield
+
+    @hookimpl(hookwrapper=True)
+    def pytest_make_collect_report(self, collector):
+        if not isinstance(collector, Module):
+            yield
+            return
+        with dependency_index.tracking(f"module:{collector.nodeid}"):
+            yield
+
+
+def environment(config):
+    """Environment the tests run against, as the dependency index keys it."""
+    if config.getoption('--replay'):
+        return f"replay:{config.getoption('--replay')}"
+    env = config.getoption('--env')
+    return env if env == 'local' else f"{env}:{config.getoption('--start_url')}"
+
+
+def pytest_configure(config):
+    client_profiler.configure(config.getoption('--profile_client'))
+    dependency_index.load(environment(config))
+    metrics_sink.configure(config.getoption('--metrics_sink'), config.getoption('--log_sample'),
+                           worker=getattr(config, 'workerinput', {}).get('workerid'))
+    config.pluginmanager.register(DependencyTracking(), 'dependency_tracking')
+
+
+@hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    client_profiler.start()
+    with dependency_index.tracking(item.nodeid):
+        yield
+    item.client_profile = client_profiler.stop(item.nodeid)
+
+
+@hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when == 'call' and request_timings.current:
+        report.sections.append(('Request timing (ms)', request_timings.section()))
+        report.user_properties.append(('request_timing', json.dumps(request_timings.current)))
+    if report.when == 'call' and getattr(item, 'client_profile', None):
+        report.sections.append(('Client profile (ms)', client_profiler.section(item.client_profile)))
+    if report.failed:
+        dependency_index.fail(item.nodeid)
+    if report.when == 'teardown':
+        dependency_index.record(item.nodeid, item.nodeid.split('::')[0], item.fixturenames)
+
+
+@fixture(autouse=True)
+def request_timing():
+    request_timings.reset()
+    yield request_timings
+
+
+@fixture(autouse=True)
+def event_correlation():
+    # the triggers of a test are not matched with the events of the next ones
+    yield correlator
+    correlator.reset()
 
 
 @fixture(scope='session')
 def get_param(request):
     config_param = {
-        "env": request.config.getoption("--env"),
+        "env": 'replay' if request.config.getoption('--replay') else request.config.getoption("--env"),
         "start_url": request.config.getoption("--start_url"),
         'jwt_key': request.config.getoption('--jwt_key'),
+        'compression': request.config.getoption('--compression'),
     }
     return config_param
 
 
 @fixture(scope='session')
-def env_config(get_param):
-    cfg = Config(get_param['env'], get_param['start_url'], get_param['jwt_key'])
+def local_server(request, get_param):
+    """In-process server of `--env local` (stand-in) and `--replay` (cassette served back), None otherwise."""
+    if get_param['env'] == 'replay':
+        server = ReplayServer(load_cassette(request.config.getoption('--replay')),
+                              pacing=request.config.getoption('--pacing')).start()
+    elif get_param['env'] == 'local':
+        server = LocalServer(jwt_key=get_param['jwt_key'] or LOCAL_JWT_KEY,
+                             latency=parse_duration(request.config.getoption('--local_latency')),
+                             jitter=parse_duration(request.config.getoption('--local_jitter'))).start()
+    else:
+        yield None
+        return
+    yield server
+    server.stop()
+
+
+@fixture(scope='session')
+def traffic_recording(request):
+    if request.config.getoption('--record'):
+        traffic.record(request.config.getoption('--record'))
+    yield traffic
+    traffic.save()
+
+
+@fixture(scope='session')
+def env_config(get_param, local_server):
+    start_url = local_server.address if local_server else get_param['start_url']
+    cfg = Config(get_param['env'], start_url, get_param['jwt_key'], get_param['compression'])
     return cfg
 
 
+# the pools depend on 'local_server' and 'traffic_recording' to be closed before the server stops
+# and the cassette is saved
+@fixture(scope='session', autouse=True)
+def gql_client_pool(request, local_server, traffic_recording):
+    client_pool.persisted_queries = request.config.getoption('--persisted_queries')
+    yield client_pool
+    for line in client_pool.summary() + request_timings.summary() + client_profiler.summary():
+        print(line)
+    client_pool.close()
+
+
+@fixture(scope='session', autouse=True)
+def gql_http_pool(request, gql_ws_pool):
+    # the async HTTP clients live on the event loop of the websocket pool: closed before it stops
+    http_pool.configure(concurrency=request.config.getoption('--http_concurrency'),
+                        persisted_queries=request.config.getoption('--persisted_queries'))
+    yield http_pool
+    ws_pool.run(http_pool.close())
+
+
+@fixture(scope='session', autouse=True)
+def gql_ws_pool(local_server, traffic_recording):
+    yield ws_pool
+    if ws_pool.reconnects:
+        print(f"[INFO] websocket reconnections: {ws_pool.reconnects}")
+    ws_pool.close()
+
+
+def run_selection(config):
+    """Tests selected by the run and the options shaping their samples, e.g. "--scaling=sizes=10/100 -m 'slo' tests"."""
+    options = [f"{option}={config.getoption(option)}" for option in [*MODES.values(), '--compression']
+               if config.getoption(option) is not None]
+    if config.getoption('--persisted_queries'):
+        options.append('--persisted_queries')
+    for flag, option in (('-m', 'markexpr'), ('-k', 'keyword')):
+        if config.getoption(option):
+            options.append(f"{flag} '{config.getoption(option)}'")
+    for arg in sorted(config.args):
+        path, *parts = str(arg).split('::')
+        options.append('::'.join([os.path.relpath(path, config.rootpath), *parts]))
+    return ' '.join(options)
+
+
+def record_history(config, env, recorder):
+    # an incremental run samples whatever changed: neither a baseline nor comparable with one
+    if not recorder.histograms or config.getoption('--incremental'):
+        return []
+    history = PerfHistory(threshold=config.getoption('--regression_threshold'))
+    run_id = history.append(env, recorder, run_selection(config))
+    regressions = history.compare(run_id)
+    history.close()
+    for r in regressions:
+        print(f"[REGRESSION] '{r['operation']}': median {round(r['baseline_median'])} ms -> "
+              f"{round(r['current_median'])} ms (+{round(r['change'] * 100)}%, p={r['p_value']:.4f})")
+    return regressions
+
+
+@hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: merge the latency samples of a finished worker
+    latency = getattr(node, 'workeroutput', {}).get('latency')
+    if latency:
+        node.config.stash[perf_env_key] = latency['env']
+        session_recorder.merge(latency)
+    dependencies = getattr(node, 'workeroutput', {}).get('dependencies')
+    if dependencies:
+        dependency_index.merge(dependencies)
+
+
+def pytest_sessionfinish(session):
+    metrics_sink.close()
+    path = session.config.getoption('--metrics_sink')
+    if path and not hasattr(session.config, 'workerinput'):
+        for line in summarize([p for p in [path, *sorted(glob(worker_path(path, 'gw*')))] if os.path.exists(p)]):
+            print(line)
+    if hasattr(session.config, 'workerinput'):
+        # pytest-xdist worker: the controller saves the dependencies recorded by all the workers
+        session.config.workeroutput['dependencies'] = dependency_index.recorded
+    else:
+        dependency_index.save()
+    if perf_env_key not in session.config.stash:
+        return
+    regressions = record_history(session.config, session.config.stash[perf_env_key], session_recorder)
+    if regressions and session.config.getoption('--fail_on_regression'):
+        session.exitstatus = 1
+
+
+@fixture(scope='session', autouse=True)
+def perf_history(request, env_config):
+    session_recorder.start()
+    yield session_recorder
+    session_recorder.stop()
+    if hasattr(request.config, 'workerinput'):
+        # pytest-xdist worker: the controller records the samples of all the workers as one run
+        request.config.workeroutput['latency'] = {'env': env_config.env, **session_recorder.to_dict()}
+        return
+    regressions = record_history(request.config, env_config.env, session_recorder)
+    if regressions and request.config.getoption('--fail_on_regression'):
+        fail(f"Latency regression detected for: {[r['operation'] for r in regressions]}")
+
+
+def role_users(env_config, local_server, role, prefix='user-conspector'):
+    """Two users minted for `role` ('session', 'seed', 'slo'), the recorded ones of the role under `--replay`."""
+    if env_config.env == 'replay':
+        # the recorded responses refer to the recorded users
+        users = [mint_user(env_config.jwt_key, uuid=uuid) for uuid in local_server.recorded_users[role][:2]]
+    else:
+        users = [mint_user(env_config.jwt_key, prefix=prefix) for _ in range(2)]
+    for user in users:
+        traffic.user(user['uuid'], role)
+    return tuple(users)
+
+
 @fixture(scope="session")
-def create_users(env_config):
-    user1_data = dict()
-    user2_data = dict()
-    for i in [user1_data, user2_data]:
-        uuid = f"user-conspector-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-        jwt_token = jwt.encode({"id": uuid, "super_admin": True, "iat": datetime.utcnow(),
-                                "exp": datetime.utcnow() + timedelta(minutes=30)},
-                               env_config.jwt_key, algorithm="HS256")
-        i.update({
-            'uuid': uuid,
-            'jwt_token': jwt_token
-        })
-    return user1_data, user2_data
+def create_users(env_config, local_server, traffic_recording):
+    return role_users(env_config, local_server, 'session')
+
+
+@fixture(scope='session', autouse=True)
+def gql_schema(request, env_config, create_users, local_server):
+    if 'prod' in argv:
+        return None
+    if local_server:
+        return local_server.schema
+    user1, _ = create_users
+    headers = {**env_config.gql_headers, "Authorization": f"Bearer {user1['jwt_token']}"}
+    return schema_cache.load(env_config.graphql_endpoint, headers,
+                             refresh=request.config.getoption('--refresh_schema'))
+
+
+@fixture(scope='session', autouse=True)
+def gql_payloads(gql_schema):
+    return registry.load(gql_schema)
+
+
+@fixture(scope="session")
+def data_factory(env_config):
+    return DataFactory(env_config)
+
+
+@fixture(scope="session")
+def seed_data(request, env_config, data_factory, local_server):
+    """
+    `conversations` conversations of a user with another one, each holding `messages` messages of the first
+    user (`--seed`). The two users are minted for the seed, so the data of `create_users` is left untouched.
+    """
+    profile = SeedProfile.parse(request.config.getoption('--seed'))
+    user1, user2 = role_users(env_config, local_server, 'seed', prefix='user-conspector-seed')
+    conversations = data_factory.create_conversations(user1, [user2['uuid']] * profile.conversations)
+    conversation_ids = [c['createConversation']['conversation']['id'] for c in conversations]
+    messages = data_factory.send_text_messages(user1, [c for c in conversation_ids for _ in range(profile.messages)])
+    message_ids = [m['sendTextMessage']['message']['id'] for m in messages]
+    print(f"[INFO] Seeded {len(conversation_ids)} conversations and {len(message_ids)} messages "
+          f"in {data_factory.requests} requests")
+    return {
+        'users': (user1, user2),
+        'conversations': conversation_ids,
+        'messages': {c: message_ids[i * profile.messages:(i + 1) * profile.messages]
+                     for i, c in enumerate(conversation_ids)}
+    }
 
 
 @fixture(scope="session")
@@ -71,6 +494,32 @@ def create_conversation(env_config, create_users):
     return result
 
 
+@fixture(scope="session")
+def slo_conversation(env_config, local_server):
+    """
+    Conversation of two users minted for the latency SLOs, holding a message of the first one: the samples
+    of the SLOs (e.g. 50 'sendTextMessage') leave the data of `create_users` untouched.
+    """
+    queries = Queries()
+    user1, user2 = role_users(env_config, local_server, 'slo', prefix='user-conspector-slo')
+    conversation, _ = queries.execute_gql(endpoint=env_config.graphql_endpoint,
+                                          user=user1,
+                                          headers=env_config.gql_headers,
+                                          raw_body='resources/gql_payload/mutations/createConversation_fixture_cut.graphql',
+                                          params={"participant": user2['uuid']})
+    conversation_id = conversation['createConversation']['conversation']['id']
+    message, _ = queries.execute_gql(endpoint=env_config.graphql_endpoint,
+                                     user=user1,
+                                     headers=env_config.gql_headers,
+                                     raw_body='resources/gql_payload/mutations/sendTextMessage_fixture_cut.graphql',
+                                     params={"conversation_id": conversation_id, "message": "This is my text message"})
+    return {
+        'users': (user1, user2),
+        'conversation_id': conversation_id,
+        'message_id': message['sendTextMessage']['message']['id']
+    }
+
+
 @fixture(scope="function")
 def send_text_message(env_config, create_users, create_conversation):
     queries = Queries()
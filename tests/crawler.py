@@ -0,0 +1,54 @@
+# ruff: noqa: E501
+from .metrics import slope
+from .queries import AsyncQueries
+
+# paginated payload -> connection field of its response
+CONNECTIONS = {
+    'conversations_page': 'conversations',
+    'conversationsWith_page': 'conversationsWith',
+    'messagesByConversation_page': 'messagesByConversation',
+}
+
+
+class PaginationCrawler:
+    """
+    Walks a cursor-paginated connection to its end with `endCursor`, one page in memory at a time.
+
+    `crawl` is an async generator yielding the edges of each page as soon as it arrives. The latency
+    of every page is kept by page depth (`latency[operation][depth]`), which tells whether the server
+    serves the deep pages as fast as the first ones or slows down with the offset.
+    """
+
+    def __init__(self, env_config, user, page_size=50, max_pages=None):
+        self.env_config = env_config
+        self.user = user
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.latency = {}
+        self._queries = AsyncQueries()
+
+    async def crawl(self, operation, params=None):
+        latency = self.latency.setdefault(operation, [])
+        after = None
+        while self.max_pages is None or len(latency) < self.max_pages:
+            result, elapsed = await self._queries.execute_http(endpoint=self.env_config.graphql_endpoint,
+                                                               user=self.user,
+                                                               headers=self.env_config.gql_headers,
+                                                               raw_body=operation,
+                                                               params={**(params or {}), 'first': self.page_size, 'after': after})
+            latency.append(elapsed)
+            page = result[CONNECTIONS[operation]]
+            for edge in page['edges']:
+                yield edge
+            if not page['pageInfo']['hasNextPage'] or not page['edges']:
+                return
+            after = page['pageInfo']['endCursor']
+
+    def report(self):
+        lines = []
+        for operation, latency in self.latency.items():
+            head, tail = latency[:max(1, len(latency) // 10)], latency[-max(1, len(latency) // 10):]
+            lines.append(f"[INFO] '{operation}': {len(latency)} pages of {self.page_size}, first pages avg "
+                         f"{round(sum(head) / len(head), 1)} ms, last pages avg {round(sum(tail) / len(tail), 1)} ms, "
+                         f"{round(slope(latency), 3):+} ms per page of depth")
+        return lines
@@ -0,0 +1,130 @@
+# ruff: noqa: E501
+import asyncio
+from copy import deepcopy
+from timeit import default_timer as timer
+from gql.transport.exceptions import TransportQueryError
+from graphql import DocumentNode, NameNode, OperationDefinitionNode, SelectionSetNode, VariableNode, Visitor, print_ast, visit
+from .cassette import traffic
+from .metrics import session_recorder
+from .payloads import registry
+from .pool import http_pool, ws_pool
+from .sink import metrics_sink
+
+
+class _SuffixVariables(Visitor):
+
+    def __init__(self, suffix):
+        super().__init__()
+        self.suffix = suffix
+
+    def enter_variable(self, node, *_):
+        return VariableNode(name=NameNode(value=f"{node.name.value}_{self.suffix}"))
+
+
+def batch_document(document, size):
+    """
+    Repeat the single operation of `document` `size` times in one document.
+
+    Copy `i` has its root fields aliased `<field>_<i>` and its variables renamed `$<variable>_<i>`.
+    """
+    operation = next(d for d in document.definitions if isinstance(d, OperationDefinitionNode))
+    variable_definitions = []
+    selections = []
+    for i in range(size):
+        copy = visit(deepcopy(operation), _SuffixVariables(i))
+        variable_definitions.extend(copy.variable_definitions or [])
+        for field in copy.selection_set.selections:
+            field.alias = NameNode(value=f"{field.name.value}_{i}")
+            selections.append(field)
+    batched = OperationDefinitionNode(operation=operation.operation,
+                                      name=NameNode(value=f"{operation.name.value if operation.name else 'batch'}_x{size}"),
+                                      variable_definitions=variable_definitions,
+                                      directives=[],
+                                      selection_set=SelectionSetNode(selections=selections))
+    fragments = [d for d in document.definitions if not isinstance(d, OperationDefinitionNode)]
+    return DocumentNode(definitions=[batched, *fragments])
+
+
+class SeedProfile:
+    """
+    Parsed value of the `--seed` option, e.g. `conversations=200,messages=10`.
+
+    conversations: number of conversations created between the two users of the seed;
+    messages: number of messages sent to each of those conversations.
+    """
+
+    def __init__(self, conversations=100, messages=10):
+        self.conversations = conversations
+        self.messages = messages
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        unknown = set(options) - {'conversations', 'messages'}
+        if unknown:
+            raise ValueError(f"Unknown seed options: {sorted(unknown)}")
+        return cls(conversations=int(options.get('conversations', 100)),
+                   messages=int(options.get('messages', 10)))
+
+
+class DataFactory:
+    """
+    Bulk provisioning of test data with aliased batch operations.
+
+    `batch_size` operations are sent in a single request on the async HTTP transport of the pool, at most
+    `window` requests are in flight at the same time. The requests run on the event loop of the websocket
+    pool, so the request counter and the latency samples are updated by a single thread. Each created entity is returned in the shape of the single operation's result
+    (e.g. `{'createConversation': {...}}`), in the order of the given parameters.
+    """
+
+    def __init__(self, env_config, batch_size=50, window=4):
+        self.env_config = env_config
+        self.batch_size = batch_size
+        self.window = window
+        self._documents = {}
+        self.requests = 0
+
+    def _document(self, operation, size):
+        key = (operation, size)
+        if key not in self._documents:
+            self._documents[key] = batch_document(registry[operation], size)
+        return self._documents[key]
+
+    async def _execute_batch(self, user, operation, params_batch, window):
+        document = self._document(operation, len(params_batch))
+        variables = {f"{name}_{i}": value for i, params in enumerate(params_batch) for name, value in (params or {}).items()}
+        session = await http_pool.session(self.env_config.graphql_endpoint, user, self.env_config.gql_headers)
+        async with window, http_pool.slot:
+            start = timer()
+            try:
+                result = await session.execute(document, variable_values=variables)
+            except Exception as e:
+                if isinstance(e, TransportQueryError):
+                    traffic.http(f"{operation}.batch", user['uuid'], print_ast(document), variables,
+                                 {'data': e.data, 'errors': e.errors}, round((timer() - start) * 1000), start)
+                metrics_sink.operation(f"{operation}.batch", user['uuid'], round((timer() - start) * 1000), 'error', size=len(params_batch))
+                raise
+            elapsed = round((timer() - start) * 1000)
+        traffic.http(f"{operation}.batch", user['uuid'], print_ast(document), variables, {'data': result}, elapsed, start)
+        self.requests += 1
+        session_recorder.record(f"{operation}.batch", elapsed)
+        metrics_sink.operation(f"{operation}.batch", user['uuid'], elapsed, size=len(params_batch))
+        fields = [f.name.value for f in registry[operation].definitions[0].selection_set.selections]
+        return [{field: result[f"{field}_{i}"] for field in fields} for i in range(len(params_batch))]
+
+    async def _execute(self, user, operation, batches):
+        window = asyncio.Semaphore(self.window)
+        return await asyncio.gather(*[self._execute_batch(user, operation, batch, window) for batch in batches])
+
+    def execute(self, user, operation, params_list):
+        batches = [params_list[i:i + self.batch_size] for i in range(0, len(params_list), self.batch_size)]
+        results = ws_pool.run(self._execute(user, operation, batches))
+        return [entity for batch in results for entity in batch]
+
+    def create_conversations(self, creator, participants, operation='createConversation_fixture_cut'):
+        return self.execute(creator, operation, [{"participant": participant} for participant in participants])
+
+    def send_text_messages(self, sender, conversation_ids, message="This is my text message",
+                           operation='sendTextMessage_fixture_cut'):
+        return self.execute(sender, operation, [{"conversation_id": conversation_id, "message": message}
+                                                for conversation_id in conversation_ids])
@@ -0,0 +1,192 @@
+# ruff: noqa: E501
+import asyncio
+from collections import Counter
+from timeit import default_timer as timer
+from .load import parse_duration
+from .metrics import Histogram
+from .payloads import registry
+from .pool import subscribe, ws_pool
+from .queries import AsyncQueries
+from .sink import metrics_sink
+from .users import mint_user
+
+# (event key, actor) identifying one event: the actor's own subscription is not expected to receive it
+EVENT_IDENTITY = {
+    'messageRead': lambda e: (e['message']['id'], e['reader']['apiId']),
+    'messageDelivered': lambda e: (e['message']['id'], e['recipient']['apiId']),
+    'userOnline': lambda e: (e['user']['apiId'], e['user']['apiId']),
+}
+
+
+class FanoutProfile:
+    """
+    Parsed value of the `--fanout` option, e.g. `participants=1000,burst=10,timeout=60s`.
+
+    participants: number of users in the conversation, all of them subscribed;
+    burst: number of participants firing the triggering operation at the same time;
+    connections: maximum number of websocket connections opened concurrently;
+    timeout: how long to wait for the expected events after the burst.
+    """
+
+    def __init__(self, participants=100, burst=10, connections=100, timeout=60.0):
+        self.participants = participants
+        self.burst = min(burst, participants - 1)
+        self.connections = connections
+        self.timeout = timeout
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        unknown = set(options) - {'participants', 'burst', 'connections', 'timeout'}
+        if unknown:
+            raise ValueError(f"Unknown fan-out options: {sorted(unknown)}")
+        return cls(participants=int(options.get('participants', 100)),
+                   burst=int(options.get('burst', 10)),
+                   connections=int(options.get('connections', 100)),
+                   timeout=parse_duration(options.get('timeout', '60s')))
+
+
+class FanoutScenario:
+    """
+    Broadcast of one subscription event type to every participant of a large conversation.
+
+    All participants subscribe with the subscriptions/*.graphql document, then `burst` participants fire
+    the triggering operation at once: 'lastSeen' for userOnline, 'markAsRead' of a fresh message for
+    messageRead, 'messagesByConversation' of a fresh message for messageDelivered. Every participant
+    except the actor is expected to receive each event exactly once. The connections of the participants
+    are closed at the end of the scenario.
+    """
+
+    def __init__(self, env_config, profile, event_name):
+        self.env_config = env_config
+        self.profile = profile
+        self.event_name = event_name
+        self.histogram = Histogram()
+        self.received = {}
+        self.triggered = {}
+        self.expected = 0
+        self.first_trigger = None
+        self.last_event = None
+        self._complete = asyncio.Event()
+        self._total_received = 0
+
+    async def _sessions(self, users):
+        semaphore = asyncio.Semaphore(self.profile.connections)
+
+        async def connect(user):
+            async with semaphore:
+                return await ws_pool.session(self.env_config.wss_endpoint, user, self.env_config.gql_headers)
+        return await asyncio.gather(*[connect(user) for user in users])
+
+    async def _subscribe(self, user, session, params, ready):
+        received = self.received[user['uuid']] = Counter()
+        query = registry[self.event_name]
+        acknowledgement = asyncio.ensure_future(
+            AsyncQueries.acknowledge(session, session.transport.on_sent(query), ready))
+        subscription = subscribe(session, query, variable_values=params)
+        try:
+            async for result in subscription:
+                received_at = timer()
+                identity = EVENT_IDENTITY[self.event_name](result[self.event_name])
+                received[identity] += 1
+                sent_at = self.triggered.get(identity)
+                if sent_at is not None and identity[1] != user['uuid'] and received[identity] == 1:
+                    self.histogram.record((received_at - sent_at) * 1000)
+                    metrics_sink.event(self.event_name, user['uuid'], round((received_at - sent_at) * 1000, 3))
+                    self.last_event = received_at
+                    self._total_received += 1
+                    if self._total_received >= self.expected:
+                        self._complete.set()
+        finally:
+            await subscription.aclose()
+            acknowledgement.cancel()
+            # a subscription which failed before its acknowledgement does not hold the burst
+            ready.set()
+
+    async def _trigger(self, session, operation, identity, params=None):
+        self.triggered[identity] = timer()
+        self.first_trigger = self.first_trigger or self.triggered[identity]
+        try:
+            await session.execute(registry[operation], variable_values=params)
+        except Exception:
+            metrics_sink.operation(operation, session.transport.user, round((timer() - self.triggered[identity]) * 1000, 3), 'error')
+            raise
+        metrics_sink.operation(operation, session.transport.user, round((timer() - self.triggered[identity]) * 1000, 3))
+
+    async def run(self):
+        users = [mint_user(self.env_config.jwt_key, prefix=f'user-conspector-fanout{i}')
+                 for i in range(self.profile.participants)]
+        try:
+            await self._run(users)
+        finally:
+            # the connections of the participants are not reused by the other scenarios
+            await ws_pool.evict(self.env_config.wss_endpoint, users)
+        return self
+
+    async def _run(self, users):
+        sessions = await self._sessions(users)
+        creator_session = sessions[0]
+        result = await creator_session.execute(registry['createConversation_fanout'],
+                                               variable_values={"participants": [u['uuid'] for u in users[1:]]})
+        conversation_id = result['createConversation']['conversation']['id']
+        message_id = None
+        if self.event_name in ('messageRead', 'messageDelivered'):
+            result = await creator_session.execute(registry['sendTextMessage_fixture_cut'],
+                                                   variable_values={"conversation_id": conversation_id,
+                                                                    "message": "Fan-out message"})
+            message_id = result['sendTextMessage']['message']['id']
+
+        params = {"conversation_id": [conversation_id]} if self.event_name == 'userOnline' else None
+        ready = [asyncio.Event() for _ in users]
+        subscriptions = [asyncio.ensure_future(self._subscribe(user, session, params, r))
+                         for user, session, r in zip(users, sessions, ready)]
+        try:
+            await asyncio.gather(*[r.wait() for r in ready])
+            actors = list(zip(users[1:], sessions[1:]))[:self.profile.burst]
+            self.expected = len(actors) * (len(users) - 1)
+            if self.event_name == 'userOnline':
+                triggers = [self._trigger(s, 'lastSeen', (u['uuid'], u['uuid'])) for u, s in actors]
+            elif self.event_name == 'messageRead':
+                triggers = [self._trigger(s, 'markAsRead', (message_id, u['uuid']), {"message_id": message_id})
+                            for u, s in actors]
+            else:
+                triggers = [self._trigger(s, 'messagesByConversation', (message_id, u['uuid']),
+                                          {"conversation_id": conversation_id}) for u, s in actors]
+            await asyncio.gather(*triggers)
+            try:
+                await asyncio.wait_for(self._complete.wait(), self.profile.timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            for subscription in subscriptions:
+                subscription.cancel()
+            await asyncio.gather(*subscriptions, return_exceptions=True)
+
+    @property
+    def missing(self):
+        missing = {}
+        for uuid, received in self.received.items():
+            absent = [i for i in self.triggered if i[1] != uuid and received[i] == 0]
+            if absent:
+                missing[uuid] = absent
+        return missing
+
+    @property
+    def duplicated(self):
+        duplicated = {}
+        for uuid, received in self.received.items():
+            repeated = {i: n for i, n in received.items() if n > 1}
+            if repeated:
+                duplicated[uuid] = repeated
+        return duplicated
+
+    def report(self):
+        span = (self.last_event - self.first_trigger) if self.last_event and self.first_trigger else 0
+        missing = sum(len(m) for m in self.missing.values())
+        duplicated = sum(sum(n - 1 for n in d.values()) for d in self.duplicated.values())
+        return [f"[INFO] '{self.event_name}' fan-out to {self.profile.participants} participants, "
+                f"burst of {len(self.triggered)}: {self.histogram.count}/{self.expected} events, "
+                f"{round(self.histogram.count / span, 1) if span else None} events/s",
+                f"[INFO] missing: {missing} events for {len(self.missing)} subscribers, "
+                f"duplicated: {duplicated} events for {len(self.duplicated)} subscribers",
+                f"[INFO] delivery latency:\n{self.histogram.distribution() if self.histogram.count else '-'}"]
@@ -0,0 +1,112 @@
+# ruff: noqa: E501
+import os
+import sqlite3
+import subprocess
+from math import erf, sqrt
+from datetime import datetime
+from statistics import median
+
+HISTORY_FILE = 'report/perf_history.sqlite3'
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided Mann-Whitney U test (normal approximation with tie correction): p-value of `current` being stochastically greater than `baseline`."""
+    n1, n2 = len(current), len(baseline)
+    ranked = sorted([(v, 0) for v in current] + [(v, 1) for v in baseline])
+    ranks = [0.0] * len(ranked)
+    ties = 0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / sigma
+    return 0.5 * (1 - erf(z / sqrt(2)))
+
+
+class PerfHistory:
+    """
+    Latency samples of every run stored in SQLite, with the environment, test selection, git revision and
+    timestamp. The selection (mode options, `-m`/`-k` expressions, test paths) tells runs of different tests
+    apart: a scaling run or a `-m` subset samples the operations differently from a full run.
+
+    Each run is compared with the rolling baseline made of the previous `window` runs of the same
+    environment and selection: an operation is flagged when its median got slower by more than `threshold` and the
+    Mann-Whitney U test says the slowdown is significant at `alpha`.
+    """
+
+    def __init__(self, path=HISTORY_FILE, window=10, threshold=0.2, alpha=0.01, min_samples=5):
+        self.path = path
+        self.window = window
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_samples = min_samples
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, timestamp TEXT, env TEXT, git_rev TEXT, selection TEXT);
+            CREATE TABLE IF NOT EXISTS samples (run_id INTEGER, operation TEXT, elapsed REAL);
+            CREATE INDEX IF NOT EXISTS samples_run_operation ON samples (run_id, operation);
+        ''')
+        if 'selection' not in [row[1] for row in self.db.execute('PRAGMA table_info(runs)')]:
+            # history written before the selection was stored: its runs are no baseline of any selection
+            self.db.execute('ALTER TABLE runs ADD COLUMN selection TEXT')
+
+    def append(self, env, recorder, selection=''):
+        cursor = self.db.execute('INSERT INTO runs (timestamp, env, git_rev, selection) VALUES (?, ?, ?, ?)',
+                                 (datetime.utcnow().isoformat(timespec='seconds'), env, git_revision(), selection))
+        run_id = cursor.lastrowid
+        self.db.executemany('INSERT INTO samples VALUES (?, ?, ?)',
+                            [(run_id, operation, value)
+                             for operation, histogram in recorder.histograms.items()
+                             for value in histogram.values()])
+        self.db.commit()
+        return run_id
+
+    def _samples(self, run_ids, operation):
+        placeholders = ','.join('?' * len(run_ids))
+        return [row[0] for row in self.db.execute(
+            f'SELECT elapsed FROM samples WHERE operation = ? AND run_id IN ({placeholders})',
+            (operation, *run_ids))]
+
+    def compare(self, run_id):
+        env, selection = self.db.execute('SELECT env, selection FROM runs WHERE id = ?', (run_id,)).fetchone()
+        baseline_runs = [row[0] for row in self.db.execute(
+            'SELECT id FROM runs WHERE env = ? AND selection = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (env, selection, run_id, self.window))]
+        regressions = []
+        if not baseline_runs:
+            return regressions
+        operations = [row[0] for row in self.db.execute(
+            'SELECT DISTINCT operation FROM samples WHERE run_id = ?', (run_id,))]
+        for operation in operations:
+            current = self._samples([run_id], operation)
+            baseline = self._samples(baseline_runs, operation)
+            if len(current) < self.min_samples or len(baseline) < self.min_samples:
+                continue
+            change = median(current) / median(baseline) - 1 if median(baseline) else 0
+            p_value = mann_whitney_greater(current, baseline)
+            if change > self.threshold and p_value < self.alpha:
+                regressions.append({'operation': operation, 'baseline_median': median(baseline),
+                                    'current_median': median(current), 'change': change, 'p_value': p_value})
+        return regressions
+
+    def close(self):
+        self.db.close()
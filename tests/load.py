@@ -0,0 +1,115 @@
+# ruff: noqa: E501
+import re
+import asyncio
+from timeit import default_timer as timer
+from .metrics import LatencyRecorder
+from .sink import metrics_sink
+from .payloads import registry
+from .users import mint_user
+from .pool import ws_pool
+
+
+def parse_duration(value):
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)(ms|s|m|h)?', value.strip())
+    if match is None:
+        raise ValueError(f"Invalid duration: '{value}'")
+    number, unit = float(match.group(1)), match.group(2) or 's'
+    return number * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+
+
+class LoadProfile:
+    """
+    Parsed value of the `--load` option, e.g. `users=500,duration=300s,ramp=30s,think=500ms`.
+
+    users: number of concurrent virtual users (rounded up to an even number, users are paired);
+    duration: how long every virtual user keeps replaying its scenario;
+    ramp: time over which the virtual users are started;
+    think: pause between two iterations of a virtual user;
+    max_error_rate: share of failed operations tolerated by the load test.
+    """
+
+    def __init__(self, users=10, duration=60.0, ramp=0.0, think=0.0, max_error_rate=0.01):
+        self.users = users + users % 2
+        self.duration = duration
+        self.ramp = ramp
+        self.think = think
+        self.max_error_rate = max_error_rate
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        unknown = set(options) - {'users', 'duration', 'ramp', 'think', 'max_error_rate'}
+        if unknown:
+            raise ValueError(f"Unknown load options: {sorted(unknown)}")
+        return cls(users=int(options.get('users', 10)),
+                   duration=parse_duration(options.get('duration', '60s')),
+                   ramp=parse_duration(options.get('ramp', '0s')),
+                   think=parse_duration(options.get('think', '0s')),
+                   max_error_rate=float(options.get('max_error_rate', 0.01)))
+
+
+class LoadRunner:
+    """
+    Replays the messaging operations with concurrent virtual users on the event loop of the
+    websocket pool, each virtual user holding a single pooled connection.
+
+    Virtual users are paired: the first user of a pair creates the conversation, then both
+    users send text messages, mark the partner's messages as read and send 'lastSeen'
+    heartbeats until the end of the run.
+    """
+
+    def __init__(self, env_config, profile):
+        self.env_config = env_config
+        self.profile = profile
+        self.recorder = LatencyRecorder()
+
+    async def _execute(self, session, operation, params=None):
+        start = timer()
+        try:
+            result = await session.execute(registry[operation], variable_values=params)
+        except Exception:
+            self.recorder.error(operation)
+            metrics_sink.operation(operation, session.transport.user, round((timer() - start) * 1000, 3), 'error')
+            return None
+        elapsed = (timer() - start) * 1000
+        self.recorder.record(operation, elapsed)
+        metrics_sink.operation(operation, session.transport.user, round(elapsed, 3))
+        return result
+
+    async def virtual_user(self, index, user, partner, conversation, inbox, partner_inbox, deadline):
+        await asyncio.sleep(self.profile.ramp * index / self.profile.users)
+        try:
+            session = await ws_pool.session(self.env_config.wss_endpoint, user, self.env_config.gql_headers)
+        except Exception:
+            self.recorder.error('connection')
+            session = None
+        if index % 2 == 0:
+            result = session and await self._execute(session, 'createConversation', {"participant": partner['uuid']})
+            conversation.set_result(result and result['createConversation']['conversation']['id'])
+        conversation_id = await conversation
+        if session is None or conversation_id is None:
+            return
+        while timer() < deadline:
+            result = await self._execute(session, 'sendTextMessage',
+                                         {"conversation_id": conversation_id,
+                                          "message": f"Load test message from {user['uuid']}"})
+            if result is not None:
+                partner_inbox.put_nowait(result['sendTextMessage']['message']['id'])
+            while not inbox.empty():
+                await self._execute(session, 'markAsRead', {"message_id": inbox.get_nowait()})
+            await self._execute(session, 'lastSeen')
+            await asyncio.sleep(self.profile.think)
+
+    async def run(self):
+        users = [mint_user(self.env_config.jwt_key, prefix=f'user-conspector-vu{i}')
+                 for i in range(self.profile.users)]
+        inboxes = [asyncio.Queue() for _ in users]
+        conversations = [asyncio.get_running_loop().create_future() for _ in range(len(users) // 2)]
+        self.recorder.start()
+        deadline = timer() + self.profile.ramp + self.profile.duration
+        await asyncio.gather(*[
+            self.virtual_user(i, users[i], users[i ^ 1], conversations[i // 2],
+                              inboxes[i], inboxes[i ^ 1], deadline)
+            for i in range(len(users))])
+        self.recorder.stop()
+        return self.recorder
@@ -0,0 +1,486 @@
+# ruff: noqa: E501
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import partial
+from timeit import default_timer as timer
+from inspect import isawaitable
+from uuid import uuid4
+import jwt
+from aiohttp import web, WSMsgType
+from graphql import ExecutionResult, GraphQLError, OperationType, build_schema, execute, get_operation_ast, parse, subscribe, validate
+
+SCHEMA_FILE = 'resources/local_server/schema.graphql'
+# smallest response body the local server compresses, as most servers skip tiny payloads
+COMPRESSION_MIN_SIZE = 1024
+# answer to an automatic persisted query whose hash is unknown: the client sends it again with its text
+PERSISTED_QUERY_NOT_FOUND = {'errors': [{'message': 'PersistedQueryNotFound', 'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}]}
+
+
+def global_id(type_name, pk):
+    return base64.b64encode(f"{type_name}:{pk}".encode()).decode()
+
+
+def now():
+    return datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+
+
+class Edge:
+
+    def __init__(self, node, cursor):
+        self.node = node
+        self.cursor = cursor
+
+
+class ConversationEdge(Edge):
+
+    def unreadCount(self, info):
+        return len(self.node.unread(info.context['viewer']))
+
+
+def connection(items, first=None, after=None, last=None, before=None, edge=Edge):
+    """Relay cursor connection over `items`, the cursor of an item being its encoded position."""
+    def position(cursor):
+        return int(base64.b64decode(cursor).decode().split(':')[1])
+    window = range(len(items))
+    if after is not None:
+        window = window[position(after) + 1:]
+    if before is not None:
+        window = window[:max(0, position(before) - window.start)]
+    has_next = has_previous = False
+    if first is not None:
+        has_next = len(window) > first
+        window = window[:first]
+    if last is not None:
+        has_previous = len(window) > last
+        window = window[max(0, len(window) - last):]
+    edges = [edge(items[i], base64.b64encode(f"cursor:{i}".encode()).decode()) for i in window]
+    return {
+        'edges': edges,
+        'pageInfo': {
+            'startCursor': edges[0].cursor if edges else None,
+            'endCursor': edges[-1].cursor if edges else None,
+            'hasNextPage': has_next,
+            'hasPreviousPage': has_previous,
+        }
+    }
+
+
+class User:
+    __typename = 'User'
+
+    def __init__(self, pk, api_id):
+        self.id = global_id('User', pk)
+        self.apiId = api_id
+        self.isOnline = False
+        self.lastSeen = None
+
+
+class Conversation:
+    __typename = 'Conversation'
+
+    def __init__(self, pk, creator, members, title):
+        self.pk = pk
+        self.id = global_id('Conversation', pk)
+        self.apiId = str(uuid4())
+        self.title = title
+        self.createdAt = now()
+        self.creator = creator
+        self.members = members
+        self.tags = []
+        self.messages = []
+
+    def participants(self, info, **page):
+        return connection(self.members, **page)
+
+    @property
+    def lastMessage(self):
+        return self.messages[-1] if self.messages else None
+
+    def unread(self, user):
+        return [m for m in self.messages if m.sender is not user and user not in m.readBy]
+
+
+class TextMessage:
+    __typename = 'TextMessage'
+
+    def __init__(self, pk, conversation, sender, body):
+        self.id = global_id('TextMessage', pk)
+        self.created = datetime.utcnow().timestamp()
+        self.createdAt = now()
+        self.conversation = conversation
+        self.sender = sender
+        self.body = body
+        self.deliveredTo = []
+        self.readBy = []
+
+
+class Participant:
+    __typename = 'Participant'
+
+    def __init__(self, conversation, user):
+        self.id = global_id('Participant', f"{conversation.pk}:{user.id}")
+        self.conversation = conversation
+        self.user = user
+
+
+class Root:
+    """Query and mutation resolvers of the local server, executed on behalf of `viewer`."""
+
+    def __init__(self, server, viewer):
+        self.server = server
+        self.viewer = viewer
+
+    def _conversation(self, conversation_id):
+        conversation = self.server.conversations.get(conversation_id)
+        if conversation is None or self.viewer not in conversation.members:
+            raise GraphQLError(f"Conversation '{conversation_id}' not found")
+        return conversation
+
+    def _own_conversations(self, tags_filter):
+        conversations = [c for c in self.server.conversations.values() if self.viewer in c.members]
+        if tags_filter and '-' not in tags_filter:
+            conversations = [c for c in conversations if set(c.tags) & set(tags_filter)]
+        return conversations
+
+    def conversations(self, info, tagsFilter=None, orderBy=None, **page):
+        conversations = self._own_conversations(tagsFilter)
+        if orderBy is None or orderBy['direction'] == 'DESC':
+            conversations.reverse()
+        return connection(conversations, edge=ConversationEdge, **page)
+
+    def conversationsWith(self, info, participants, tagsFilter=None, **page):
+        conversations = [c for c in self._own_conversations(tagsFilter)
+                         if set(participants) <= {m.apiId for m in c.members}]
+        return connection(conversations, edge=ConversationEdge, **page)
+
+    def messagesByConversation(self, info, conversationId, **page):
+        conversation = self._conversation(conversationId)
+        result = connection(conversation.messages, **page)
+        # the messages fetched by a participant are delivered to them
+        for message in (edge.node for edge in result['edges']):
+            if message.sender is not self.viewer and self.viewer not in message.deliveredTo:
+                message.deliveredTo.append(self.viewer)
+                self.server.publish('messageDelivered', {'message': message, 'recipient': self.viewer},
+                                    conversation.members, actor=self.viewer)
+        return result
+
+    def unreadMessages(self, info, conversationId, **page):
+        return connection(self._conversation(conversationId).unread(self.viewer), **page)
+
+    def participantsWithUnreadMessages(self, info, unreadFrom, **page):
+        participants = [Participant(c, u) for c in self.server.conversations.values() for u in c.members
+                        if any(m.created >= unreadFrom for m in c.unread(u))]
+        return connection(participants, **page)
+
+    def userMeta(self, info):
+        return {'unreadCount': sum(len(c.unread(self.viewer)) for c in self._own_conversations(None)),
+                'user': self.viewer}
+
+    def createConversation(self, info, input):
+        members = [self.viewer] + [self.server.user(api_id) for api_id in input['participants']
+                                   if api_id != self.viewer.apiId]
+        conversation = self.server.add_conversation(self.viewer, members, input.get('title'))
+        return {'conversation': conversation}
+
+    def sendTextMessage(self, info, input):
+        conversation = self._conversation(input['conversationId'])
+        return {'message': self.server.add_message(conversation, self.viewer, input['body'])}
+
+    def markAsRead(self, info, input):
+        message = self.server.messages.get(input['messageId'])
+        if message is None or self.viewer not in message.conversation.members:
+            raise GraphQLError(f"Message '{input['messageId']}' not found")
+        if self.viewer not in message.readBy:
+            message.readBy.append(self.viewer)
+            self.server.publish('messageRead', {'message': message, 'reader': self.viewer},
+                                message.conversation.members, actor=self.viewer)
+        return {'message': message}
+
+    def lastSeen(self, info):
+        self.viewer.isOnline = True
+        self.viewer.lastSeen = now()
+        for conversation in self._own_conversations(None):
+            self.server.publish('userOnline', {'conversation': conversation, 'user': self.viewer},
+                                conversation.members, actor=self.viewer)
+        return {'success': True}
+
+    def _conversation_by_api_id(self, conversation_api_id):
+        for conversation in self._own_conversations(None):
+            if conversation.apiId == conversation_api_id:
+                return conversation
+        raise GraphQLError(f"Conversation '{conversation_api_id}' not found")
+
+    def addConversationTag(self, info, input):
+        conversation = self._conversation_by_api_id(input['conversationApiId'])
+        if input['tagName'] not in conversation.tags:
+            conversation.tags.append(input['tagName'])
+        return True
+
+    def removeConversationTag(self, info, input):
+        conversation = self._conversation_by_api_id(input['conversationApiId'])
+        if input['tagName'] in conversation.tags:
+            conversation.tags.remove(input['tagName'])
+        return True
+
+
+class BackgroundServer(ABC):
+    """
+    aiohttp application served on `host`:`port` (an ephemeral port by default) by a daemon thread.
+
+    The GraphQL requests it serves over HTTP may be automatic persisted queries, resolved by `_persisted_query`.
+    """
+    description = 'Server'
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._persisted_queries = {}
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    def _persisted_query(self, body):
+        """Query text of a request: sent, or registered before under the sha256 hash of its `persistedQuery`."""
+        persisted = (body.get('extensions') or {}).get('persistedQuery')
+        if persisted is None:
+            return body.get('query')
+        if body.get('query') is not None:
+            if hashlib.sha256(body['query'].encode()).hexdigest() != persisted['sha256Hash']:
+                raise web.HTTPBadRequest(text='provided sha does not match query')
+            self._persisted_queries[persisted['sha256Hash']] = body['query']
+        return self._persisted_queries.get(persisted['sha256Hash'])
+
+    @abstractmethod
+    def routes(self, app):
+        """Adds the handlers of the server to the aiohttp application `app`."""
+
+    async def _start(self):
+        app = web.Application()
+        self.routes(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=self.description, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result(timeout=10)
+        print(f"[INFO] {self.description} listening on {self.address}")
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        self._loop = None
+
+
+class LocalServer(BackgroundServer):
+    """
+    In-process stand-in of the messaging GraphQL server, for hermetic runs (`--env local`).
+
+    Serves the schema of resources/local_server/schema.graphql from memory: queries and mutations
+    over HTTP on `/graphql`, every operation and the `messageRead`, `messageDelivered` and `userOnline`
+    subscriptions over the 'graphql-ws' protocol on `/graphql-ws`. Requests are authenticated with
+    the HS256 JWTs minted by `mint_user`. `latency` (± `jitter`) seconds are injected before every
+    operation result and every subscription event. HTTP requests may send automatic persisted queries.
+    """
+    description = 'Local server'
+
+    def __init__(self, jwt_key, host='127.0.0.1', port=0, latency=0.0, jitter=0.0):
+        super().__init__(host, port)
+        self.jwt_key = jwt_key
+        self.latency = latency
+        self.jitter = jitter
+        with open(SCHEMA_FILE) as f:
+            self.schema = build_schema(f.read())
+        for field in self.schema.subscription_type.fields.values():
+            field.subscribe = self._events
+        self.users = {}
+        self.conversations = {}
+        self.messages = {}
+        self._subscribers = []
+        self._documents = {}
+
+    def user(self, api_id):
+        if api_id not in self.users:
+            self.users[api_id] = User(len(self.users) + 1, api_id)
+        return self.users[api_id]
+
+    def add_conversation(self, creator, members, title):
+        conversation = Conversation(len(self.conversations) + 1, creator, members, title)
+        self.conversations[conversation.id] = conversation
+        return conversation
+
+    def add_message(self, conversation, sender, body):
+        message = TextMessage(len(self.messages) + 1, conversation, sender, body)
+        self.messages[message.id] = message
+        conversation.messages.append(message)
+        return message
+
+    def publish(self, event_name, payload, audience, actor=None):
+        audience = set(audience)
+        for viewer, name, args, queue in self._subscribers:
+            if name != event_name or viewer not in audience or viewer is actor:
+                continue
+            if 'conversationIds' in args and payload['conversation'].id not in args['conversationIds']:
+                continue
+            queue.put_nowait({event_name: payload})
+
+    async def _events(self, root, info, **args):
+        subscriber = (root.viewer, info.field_name, args, asyncio.Queue())
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                yield await subscriber[3].get()
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def _viewer(self, authorization):
+        token = (authorization or '').replace('Bearer ', '', 1).strip()
+        try:
+            claims = jwt.decode(token, self.jwt_key, algorithms=['HS256'])
+        except jwt.InvalidTokenError as e:
+            raise GraphQLError(f"Unauthorized: {e}")
+        return self.user(claims['id'])
+
+    async def _delay(self):
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _document(self, query):
+        # parsed and validated once per query text, as a server with a document cache
+        if query not in self._documents:
+            try:
+                document = parse(query)
+            except GraphQLError as e:
+                self._documents[query] = None, [e]
+            else:
+                self._documents[query] = document, validate(self.schema, document)
+        return self._documents[query]
+
+    async def _execute(self, query, root, variables, operation_name):
+        document, errors = self._document(query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        result = execute(self.schema, document, root, {'viewer': root.viewer}, variables, operation_name)
+        return await result if isawaitable(result) else result
+
+    async def _http(self, request):
+        start = timer()
+        try:
+            viewer = self._viewer(request.headers.get('Authorization'))
+        except GraphQLError as e:
+            return web.json_response({'errors': [e.formatted]}, status=401)
+        body = await request.json()
+        query = self._persisted_query(body)
+        if query is None:
+            return web.json_response(PERSISTED_QUERY_NOT_FOUND)
+        result = await self._execute(query, Root(self, viewer), body.get('variables'),
+                                     body.get('operationName'))
+        await self._delay()
+        response = {'data': result.data}
+        if result.errors:
+            response['errors'] = [e.formatted for e in result.errors]
+        response = web.json_response(response, headers={
+            'Server-Timing': f"app;dur={round((timer() - start) * 1000, 3)}"})
+        if len(response.body) >= COMPRESSION_MIN_SIZE:
+            # the encoding is negotiated with the request's 'Accept-Encoding'
+            response.enable_compression()
+        return response
+
+    @staticmethod
+    async def _send(ws, operation_id, result):
+        payload = {'data': result.data}
+        if result.errors:
+            payload['errors'] = [e.formatted for e in result.errors]
+        await ws.send_json({'type': 'data', 'id': operation_id, 'payload': payload})
+
+    async def _operation(self, ws, viewer, operation_id, payload):
+        stream = None
+        try:
+            document, errors = self._document(payload['query'])
+            operation = get_operation_ast(document, payload.get('operationName')) if document else None
+            if errors or operation is None:
+                errors = errors or [GraphQLError('Unknown operation')]
+                await ws.send_json({'type': 'error', 'id': operation_id, 'payload': errors[0].formatted})
+                return
+            root = Root(self, viewer)
+            if operation.operation == OperationType.SUBSCRIPTION:
+                stream = await subscribe(self.schema, document, root, {'viewer': viewer}, payload.get('variables'),
+                                         payload.get('operationName'))
+                if isinstance(stream, ExecutionResult):
+                    await self._send(ws, operation_id, stream)
+                    return
+                async for result in stream:
+                    await self._delay()
+                    await self._send(ws, operation_id, result)
+            else:
+                result = await self._execute(payload['query'], root, payload.get('variables'),
+                                             payload.get('operationName'))
+                await self._delay()
+                await self._send(ws, operation_id, result)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if stream is not None and not isinstance(stream, ExecutionResult):
+                await stream.aclose()
+            if not ws.closed:
+                await ws.send_json({'type': 'complete', 'id': operation_id})
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse(protocols=('graphql-ws',))
+        await ws.prepare(request)
+        viewer = None
+        operations = {}
+
+        def forget(operation_id, task):
+            # operation stopped or complete, unless its id has been reused by a newer one meanwhile
+            if operations.get(operation_id) is task:
+                del operations[operation_id]
+
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            message = json.loads(message.data)
+            if message['type'] == 'connection_init':
+                try:
+                    viewer = self._viewer(request.headers.get('Authorization')
+                                          or (message.get('payload') or {}).get('Authorization'))
+                except GraphQLError as e:
+                    await ws.send_json({'type': 'connection_error', 'payload': e.formatted})
+                    break
+                await ws.send_json({'type': 'connection_ack'})
+            elif message['type'] == 'start' and viewer is not None:
+                operations[message['id']] = asyncio.ensure_future(
+                    self._operation(ws, viewer, message['id'], message['payload']))
+                operations[message['id']].add_done_callback(partial(forget, message['id']))
+            elif message['type'] == 'stop' and message['id'] in operations:
+                operations.pop(message['id']).cancel()
+            elif message['type'] == 'connection_terminate':
+                break
+        for operation in list(operations.values()):
+            operation.cancel()
+        await ws.close()
+        return ws
+
+    def routes(self, app):
+        app.router.add_post('/graphql', self._http)
+        app.router.add_get('/graphql-ws', self._websocket)
@@ -0,0 +1,179 @@
+# ruff: noqa: E501
+from math import ceil, log2
+from timeit import default_timer as timer
+
+PERCENTILES = (50, 90, 95, 99)
+DISTRIBUTION_PERCENTILES = (0, 10, 25, 50, 75, 90, 95, 99, 99.9, 100)
+
+
+def slope(values):
+    """Least-squares slope of `values` over their index, e.g. ms per page of depth."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    variance = sum((x - mean_x) ** 2 for x in range(n))
+    return covariance / variance
+
+
+class Histogram:
+    """
+    HDR-style latency histogram: fixed relative precision with memory independent of the sample count.
+
+    Values are recorded in milliseconds and stored in microsecond units. Values below
+    `sub_bucket_count` µs are counted exactly, larger values are grouped in log-linear
+    buckets of `sub_bucket_count / 2` linear sub-buckets per power of two, which keeps
+    `significant_figures` decimal digits of precision. Percentiles return the highest
+    value equivalent to the bucket, as HdrHistogram does.
+    """
+
+    def __init__(self, significant_figures=2):
+        self.sub_bucket_bits = ceil(log2(2 * 10 ** significant_figures))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _key(self, units):
+        shift = max(0, units.bit_length() - self.sub_bucket_bits)
+        return shift, units >> shift
+
+    @staticmethod
+    def _highest_equivalent(key):
+        shift, sub_bucket = key
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        units = max(0, round(value * 1000))
+        key = self._key(units)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.count += count
+        self.total += units * count
+        self.min = units if self.min is None else min(self.min, units)
+        self.max = units if self.max is None else max(self.max, units)
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for bound in (other.min, other.max):
+            if bound is not None:
+                self.min = bound if self.min is None else min(self.min, bound)
+                self.max = bound if self.max is None else max(self.max, bound)
+
+    @property
+    def mean(self):
+        return round(self.total / self.count / 1000, 3) if self.count else None
+
+    def _percentile_bucket(self, p):
+        """Value (µs units) of the `p` percentile and the number of samples up to its bucket, included."""
+        if p >= 100:
+            return self.max, self.count
+        rank = max(1, ceil(p / 100 * self.count))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self._highest_equivalent(key), self.max), seen
+        return self.max, self.count
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        return self._percentile_bucket(p)[0] / 1000
+
+    def values(self):
+        for key in sorted(self.counts):
+            value = min(self._highest_equivalent(key), self.max) / 1000
+            for _ in range(self.counts[key]):
+                yield value
+
+    def to_dict(self):
+        return {'sub_bucket_bits': self.sub_bucket_bits,
+                'counts': [[shift, sub_bucket, count] for (shift, sub_bucket), count in self.counts.items()],
+                'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.sub_bucket_bits = data['sub_bucket_bits']
+        histogram.sub_bucket_count = 1 << histogram.sub_bucket_bits
+        histogram.counts = {(shift, sub_bucket): count for shift, sub_bucket, count in data['counts']}
+        histogram.count, histogram.total = data['count'], data['total']
+        histogram.min, histogram.max = data['min'], data['max']
+        return histogram
+
+    def distribution(self):
+        # TotalCount: samples up to the bucket of the percentile, as HdrHistogram prints them
+        lines = [f"{'Percentile':>12} {'Value(ms)':>12} {'TotalCount':>10}"]
+        if not self.count:
+            lines.append("#[No samples, Total count = 0]")
+            return "\n".join(lines)
+        for p in DISTRIBUTION_PERCENTILES:
+            value, total_count = self._percentile_bucket(p)
+            lines.append(f"{p:>12} {value / 1000:>12.3f} {total_count:>10}")
+        lines.append(f"#[Mean = {self.mean} ms, Min = {self.min / 1000} ms, Max = {self.max / 1000} ms, "
+                     f"Total count = {self.count}]")
+        return "\n".join(lines)
+
+
+class LatencyRecorder:
+    """Latency histograms (ms) and error counts per operation, with throughput over the recording window."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.started = None
+        self.stopped = None
+
+    def start(self):
+        self.started = timer()
+
+    def stop(self):
+        self.stopped = timer()
+
+    @property
+    def duration(self):
+        return (self.stopped or timer()) - self.started
+
+    def record(self, operation, elapsed):
+        self.histograms.setdefault(operation, Histogram()).record(elapsed)
+
+    def error(self, operation):
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def to_dict(self):
+        return {'histograms': {operation: h.to_dict() for operation, h in self.histograms.items()},
+                'errors': self.errors}
+
+    def merge(self, data):
+        for operation, histogram in data['histograms'].items():
+            self.histograms.setdefault(operation, Histogram()).merge(Histogram.from_dict(histogram))
+        for operation, count in data['errors'].items():
+            self.errors[operation] = self.errors.get(operation, 0) + count
+
+    @property
+    def total(self):
+        return sum(h.count for h in self.histograms.values()) + sum(self.errors.values())
+
+    @property
+    def total_errors(self):
+        return sum(self.errors.values())
+
+    def report(self):
+        lines = [f"[INFO] {self.total} operations in {round(self.duration, 1)} s, "
+                 f"{round(self.total / self.duration, 1)} ops/s, {self.total_errors} errors"]
+        for operation in sorted(set(self.histograms) | set(self.errors)):
+            histogram = self.histograms.get(operation, Histogram())
+            distribution = ", ".join(f"p{p}: {histogram.percentile(p)} ms" for p in PERCENTILES)
+            lines.append(f"[INFO] '{operation}': {histogram.count} ok, {self.errors.get(operation, 0)} errors, "
+                         f"{round(histogram.count / self.duration, 1)} ops/s, {distribution}, "
+                         f"max: {histogram.percentile(100)} ms")
+        return lines
+
+
+session_recorder = LatencyRecorder()
@@ -0,0 +1,69 @@
+# ruff: noqa: E501
+import os
+from gql import gql
+from graphql import validate
+
+PAYLOAD_DIR = 'resources/gql_payload'
+PAYLOAD_KINDS = ('queries', 'mutations', 'subscriptions')
+
+
+class PayloadRegistry:
+    """
+    Every document of resources/gql_payload, parsed once and looked up by name.
+
+    `registry['sendTextMessage']` and `registry['resources/gql_payload/mutations/sendTextMessage.graphql']`
+    return the same parsed document. When a schema is given to `load`, each document is validated
+    against it once, so clients don't have to re-validate on every execution. The names looked up are
+    added to `reads` when it is set (dependencies of a test, see tests/selection.py).
+    """
+
+    def __init__(self, root=PAYLOAD_DIR):
+        self.root = root
+        self.paths = {}
+        self.reads = None
+        self._documents = {}
+
+    def load(self, schema=None):
+        documents = {}
+        for kind in PAYLOAD_KINDS:
+            kind_dir = os.path.join(self.root, kind)
+            for file_name in sorted(os.listdir(kind_dir)):
+                name, ext = os.path.splitext(file_name)
+                if ext != '.graphql':
+                    continue
+                path = os.path.join(kind_dir, file_name)
+                with open(path, 'r') as f:
+                    document = gql(f.read())
+                if schema is not None:
+                    errors = validate(schema, document)
+                    if errors:
+                        raise ValueError(f"Payload '{path}' does not match the schema: {errors[0].message}")
+                documents[name] = document
+                self.paths[name] = path
+        self._documents = documents
+        return self
+
+    @staticmethod
+    def name(raw_body):
+        return os.path.splitext(os.path.basename(raw_body))[0]
+
+    def __getitem__(self, raw_body):
+        if not self._documents:
+            self.load()
+        name = self.name(raw_body)
+        if self.reads is not None:
+            self.reads.add(name)
+        return self._documents[name]
+
+    def __contains__(self, raw_body):
+        if not self._documents:
+            self.load()
+        return self.name(raw_body) in self._documents
+
+    def __iter__(self):
+        if not self._documents:
+            self.load()
+        return iter(self._documents)
+
+
+registry = PayloadRegistry()
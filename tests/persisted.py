@@ -0,0 +1,74 @@
+# ruff: noqa: E501
+from statistics import median
+from timeit import default_timer as timer
+from graphql import print_ast
+from .cassette import traffic
+from .payloads import registry
+from .pool import client_pool
+
+MODES = ('full', 'apq')
+
+
+class PersistedQueryBenchmark:
+    """
+    Request size and latency of operations sent with their full text and as automatic persisted queries.
+
+    The two modes are interleaved sample by sample, on two keep-alive clients of the same user, so that
+    both see the same server state. The first persisted execution of a document, which registers its
+    text on the server when it is unknown, is reported apart from the samples. Every execution is recorded
+    in the cassette while recording, so that `--replay` serves both modes.
+    """
+
+    def __init__(self, env_config, user, operations, samples=20):
+        self.env_config = env_config
+        self.user = user
+        self.operations = operations
+        self.samples = samples
+        self.registrations = {}
+        self.misses = {}
+        self.mismatches = []
+        self.results = {operation: {mode: {'elapsed': [], 'request': [], 'wire': []} for mode in MODES}
+                        for operation in operations}
+
+    def _execute(self, operation, params, mode):
+        session = client_pool.session(self.env_config.graphql_endpoint, self.user, self.env_config.gql_headers,
+                                      persisted_queries=mode == 'apq')
+        start = timer()
+        result = session.execute(registry[operation], variable_values=params)
+        elapsed = (timer() - start) * 1000
+        traffic.http(operation, self.user['uuid'], print_ast(registry[operation]), params, {'data': result}, round(elapsed), start)
+        return result, elapsed, session.transport.last_timing
+
+    def run(self):
+        for operation, params in self.operations.items():
+            _, elapsed, timing = self._execute(operation, params, 'apq')
+            self.registrations[operation] = {'elapsed': elapsed, 'request': timing['bytes']['request'],
+                                             'persisted_query': timing['persisted_query']}
+            for _ in range(self.samples):
+                responses = {}
+                for mode in MODES:
+                    responses[mode], elapsed, timing = self._execute(operation, params, mode)
+                    samples = self.results[operation][mode]
+                    samples['elapsed'].append(elapsed)
+                    samples['request'].append(timing['bytes']['request'])
+                    samples['wire'].append(timing['bytes']['wire'])
+                    if timing.get('persisted_query') == 'miss':
+                        self.misses[operation] = self.misses.get(operation, 0) + 1
+                if responses['full'] != responses['apq']:
+                    self.mismatches.append(operation)
+        return self
+
+    def medians(self, operation, mode):
+        return {key: median(values) for key, values in self.results[operation][mode].items()}
+
+    def report(self):
+        lines = []
+        for operation in self.operations:
+            full, apq = self.medians(operation, 'full'), self.medians(operation, 'apq')
+            registration = self.registrations[operation]
+            lines.append(f"[INFO] '{operation}': request {round(full['request'])} B -> {round(apq['request'])} B "
+                         f"({round((apq['request'] / full['request'] - 1) * 100):+}%), median {round(full['elapsed'], 2)} ms -> "
+                         f"{round(apq['elapsed'], 2)} ms ({round((apq['elapsed'] / full['elapsed'] - 1) * 100):+}%), "
+                         f"first persisted execution: {registration['persisted_query']} in {round(registration['elapsed'], 2)} ms, "
+                         f"{registration['request']} B")
+        return lines
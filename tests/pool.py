@@ -0,0 +1,297 @@
+# ruff: noqa: E501
+import asyncio
+import threading
+from itertools import count
+from timeit import default_timer as timer
+from gql import Client, gql
+from aiohttp import TCPConnector
+from gql.transport.exceptions import TransportQueryError
+from gql.transport.websockets import WebsocketsTransport
+from .cassette import NO_RECORDED_RESPONSE, traffic
+from .timing import TimedAIOHTTPTransport, TimedRequestsHTTPTransport
+
+READINESS_PROBE = gql('query readinessProbe { __typename }')
+
+
+class ClientPool:
+    """
+    Keep-alive gql clients shared by the whole session, one per (endpoint, user).
+
+    A client opens its connection (TCP/TLS handshake) when it is created, with a readiness
+    probe whose time is recorded as 'cold': the operations executed on it reuse the
+    connection and are recorded as 'warm', the handshake is never part of their time.
+    A client whose probe fails is not pooled. Clients of different keys are created concurrently.
+
+    With `persisted_queries` the clients send the documents as automatic persisted queries;
+    `session(..., persisted_queries=...)` overrides it for one client.
+    """
+
+    def __init__(self, persisted_queries=False):
+        self.persisted_queries = persisted_queries
+        self._sessions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.latency = {'cold': [], 'warm': []}
+
+    def session(self, endpoint, user, headers, persisted_queries=None):
+        persisted_queries = self.persisted_queries if persisted_queries is None else persisted_queries
+        key = (endpoint, user['uuid'], persisted_queries)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # the readiness probe of a client does not hold the creation of the clients of other keys
+        with lock:
+            if key not in self._sessions:
+                user_headers = {**headers, "Authorization": f"Bearer {user['jwt_token']}"}
+                transport = TimedRequestsHTTPTransport(
+                    url=endpoint,
+                    use_json=True,
+                    headers=user_headers,
+                    persisted_queries=persisted_queries
+                )
+                client = Client(transport=transport)
+                session = client.__enter__()
+                try:
+                    self._connect(session)
+                except Exception:
+                    client.__exit__()
+                    raise
+                self._sessions[key] = (client, session)
+            return self._sessions[key][1]
+
+    def _connect(self, session):
+        start = timer()
+        try:
+            session.execute(READINESS_PROBE)
+        except TransportQueryError as e:
+            if not any(error.get('message') == NO_RECORDED_RESPONSE for error in e.errors or []):
+                raise
+            # replay server without the probe in its cassette: the connection is open all the same
+            return
+        self.latency['cold'].append(round((timer() - start) * 1000))
+
+    def record(self, elapsed):
+        self.latency['warm'].append(elapsed)
+
+    def summary(self):
+        lines = []
+        for kind, samples in self.latency.items():
+            if samples:
+                lines.append(f"[INFO] {kind} connections: {len(samples)} samples, "
+                             f"avg {round(sum(samples) / len(samples))} ms, max {max(samples)} ms")
+        return lines
+
+    def close(self):
+        for client, _ in self._sessions.values():
+            client.__exit__()
+        self._sessions.clear()
+        self._locks.clear()
+
+
+class NotifyingWebsocketsTransport(WebsocketsTransport):
+    """
+    WebsocketsTransport that resolves a future once the 'start' frame of a document has been sent.
+
+    Its frames are recorded in the `traffic` cassette while recording. `user`: uuid of the user the
+    connection is authenticated as.
+    """
+    connections = count()
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self._sent_waiters = {}
+        self.connection = next(self.connections)
+
+    async def _send(self, message):
+        await super()._send(message)
+        traffic.frame(self.connection, 'send', message)
+
+    async def _receive(self):
+        message = await super()._receive()
+        traffic.frame(self.connection, 'recv', message)
+        return message
+
+    def on_sent(self, document):
+        future = asyncio.get_running_loop().create_future()
+        self._sent_waiters.setdefault(id(document), []).append(future)
+        return future
+
+    async def _send_query(self, document, variable_values=None, operation_name=None):
+        query_id = await super()._send_query(document, variable_values, operation_name)
+        waiters = self._sent_waiters.get(id(document))
+        if waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                future.set_result(query_id)
+            if not waiters:
+                del self._sent_waiters[id(document)]
+        return query_id
+
+
+async def subscribe(session, document, variable_values=None):
+    """
+    `session.subscribe` whose aclose() sends 'stop' for the operation.
+
+    Closing the generator of `session.subscribe` does not close the transport's generator it wraps:
+    the operation stays subscribed on the pooled connection, and closing the connection then waits for
+    its 'complete' until the close timeout.
+    """
+    inner = session.transport.subscribe(document, variable_values=variable_values)
+    try:
+        async for result in inner:
+            if result.errors:
+                raise TransportQueryError(str(result.errors[0]), errors=result.errors, data=result.data)
+            if result.data is not None:
+                yield result.data
+    finally:
+        await inner.aclose()
+
+
+class WebSocketPool:
+    """
+    Long-lived graphql-ws connections shared by the whole session, one per (endpoint, user).
+
+    Each connection multiplexes any number of concurrent operations and subscriptions (one
+    operation id each), so tests attach and detach subscriptions without reconnecting.
+    The connections live on a dedicated event loop thread: coroutines using them are
+    executed with `run`. A connection closed by the server is re-opened on next use.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._clients = {}
+        self._locks = {}
+        self.reconnects = 0
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='ws-pool', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    @property
+    def thread(self):
+        self.loop
+        return self._thread
+
+    @staticmethod
+    async def _outcome(coro):
+        # BaseExceptions (e.g. pytest's fail()) must not escape into the loop thread
+        try:
+            return await coro, None
+        except BaseException as e:
+            return None, e
+
+    def run(self, coro, timeout=None):
+        result, error = asyncio.run_coroutine_threadsafe(self._outcome(coro), self.loop).result(timeout)
+        if error is not None:
+            raise error
+        return result
+
+    async def session(self, endpoint, user, headers):
+        key = (endpoint, user['uuid'])
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            if key in self._clients:
+                client, session = self._clients[key]
+                if client.transport.websocket is not None:
+                    return session
+                self.reconnects += 1
+            user_headers = {**headers, "Authorization": f"Bearer {user['jwt_token']}"}
+            transport = NotifyingWebsocketsTransport(url=endpoint, init_payload=user_headers, headers=user_headers,
+                                                     user=user['uuid'])
+            client = Client(transport=transport)
+            self._clients[key] = (client, await client.__aenter__())
+            return self._clients[key][1]
+
+    async def _close(self, key):
+        self._locks.pop(key, None)
+        client, _ = self._clients.pop(key, (None, None))
+        if client is not None and client.transport.websocket is not None:
+            await client.__aexit__(None, None, None)
+
+    async def evict(self, endpoint, users):
+        """Closes the connections of `users` before the end of the session, e.g. the participants of a scenario."""
+        await asyncio.gather(*[self._close((endpoint, user['uuid'])) for user in users])
+
+    async def _close_all(self):
+        for client, _ in self._clients.values():
+            if client.transport.websocket is not None:
+                await client.__aexit__(None, None, None)
+        self._clients.clear()
+        self._locks.clear()
+
+    def close(self):
+        if self._loop is None:
+            return
+        self.run(self._close_all())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+class AsyncHTTPPool:
+    """
+    gql clients over aiohttp shared by the whole session, one per (endpoint, user), for the
+    queries and mutations executed on the event loop of the websocket pool.
+
+    All the clients share one aiohttp connector (keep-alive connections, at most `connections`
+    open), and at most `concurrency` operations are in flight at once: the others wait for a slot.
+    With `persisted_queries` the clients send the documents as automatic persisted queries, as the
+    clients of `ClientPool` do.
+    """
+
+    def __init__(self, concurrency=100, connections=100, persisted_queries=False):
+        self.concurrency = concurrency
+        self.connections = connections
+        self.persisted_queries = persisted_queries
+        self._connector = None
+        self._semaphore = None
+        self._clients = {}
+        self._locks = {}
+
+    def configure(self, concurrency=None, connections=None, persisted_queries=None):
+        self.concurrency = concurrency or self.concurrency
+        self.connections = connections or self.connections
+        if persisted_queries is not None:
+            self.persisted_queries = persisted_queries
+
+    @property
+    def slot(self):
+        """Async context manager holding one of the `concurrency` slots."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def session(self, endpoint, user, headers):
+        key = (endpoint, user['uuid'])
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            if key not in self._clients:
+                if self._connector is None:
+                    self._connector = TCPConnector(limit=self.connections)
+                user_headers = {**headers, "Authorization": f"Bearer {user['jwt_token']}"}
+                # the transport decompresses the responses itself, to measure their size on the wire
+                transport = TimedAIOHTTPTransport(url=endpoint, headers=user_headers, persisted_queries=self.persisted_queries,
+                                                  client_session_args={'connector': self._connector, 'connector_owner': False,
+                                                                       'auto_decompress': False})
+                client = Client(transport=transport)
+                self._clients[key] = (client, await client.__aenter__())
+            return self._clients[key][1]
+
+    async def close(self):
+        for client, _ in self._clients.values():
+            await client.__aexit__(None, None, None)
+        self._clients.clear()
+        self._locks.clear()
+        if self._connector is not None:
+            await self._connector.close()
+        self._connector = None
+        self._semaphore = None
+
+
+client_pool = ClientPool()
+ws_pool = WebSocketPool()
+http_pool = AsyncHTTPPool()
@@ -0,0 +1,210 @@
+# ruff: noqa: E501
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from .pool import ws_pool
+
+PROFILE_DIR = 'report/profiles'
+PROFILERS = ('cprofile', 'sampling')
+
+
+def thread_cpu_time(thread):
+    """CPU time (s) consumed so far by `thread`, None where per-thread clocks are not available."""
+    if thread is None or not hasattr(time, 'pthread_getcpuclockid'):
+        return None
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (OSError, TypeError):
+        return None
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler: the stacks of the profiled threads are sampled every `interval`
+    seconds from a background thread, and counted as folded stacks ('thread;module:function;... count'),
+    the input format of flame graph tools (flamegraph.pl, speedscope, inferno).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._threads = {}
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def add_thread(self, thread, loop=None):
+        self._threads[thread.ident] = thread.name
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, name in self._threads.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join([name, *reversed(stack)])] += 1
+
+    def start(self):
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name='client-profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def save(self, path):
+        with open(f"{path}.folded", 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return f"{path}.folded"
+
+
+class DeterministicProfiler:
+    """
+    cProfile of the test thread and of the event loop thread of the websocket pool, merged in one pstats file.
+
+    From Python 3.12 cProfile hooks `sys.monitoring`, a single profiler for the whole process: only the
+    first thread added, the test thread, is profiled there.
+    """
+
+    def __init__(self):
+        self._profiles = []
+
+    def add_thread(self, thread, loop=None):
+        """`loop`: event loop running in `thread`, when it is not the current thread."""
+        if self._profiles and sys.version_info >= (3, 12):
+            return
+        self._profiles.append((cProfile.Profile(), loop))
+
+    @staticmethod
+    def _call(loop, fn):
+        if loop is None:
+            fn()
+            return
+        # the profiler hooks the thread it is enabled in
+        done = threading.Event()
+        error = []
+
+        def call():
+            try:
+                fn()
+            except Exception as e:
+                error.append(e)
+            finally:
+                done.set()
+        loop.call_soon_threadsafe(call)
+        done.wait()
+        if error:
+            raise error[0]
+
+    def start(self):
+        for profile, loop in self._profiles:
+            self._call(loop, profile.enable)
+
+    def stop(self):
+        for profile, loop in self._profiles:
+            self._call(loop, profile.disable)
+
+    def save(self, path):
+        stats = None
+        for profile, _ in self._profiles:
+            profile.create_stats()
+            if profile.stats:
+                stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(f"{path}.prof")
+        return f"{path}.prof"
+
+
+class ClientProfiler:
+    """
+    Client-side cost of the operations (`--profile_client`): CPU time of the client versus time waiting on
+    the network, per operation, and a profile of every test saved in report/profiles.
+
+    The CPU time of an HTTP operation is the CPU time of its thread while it executes. The operations on
+    the websocket pool's event loop share its thread, so their CPU time also counts the coroutines run
+    meanwhile; the busy share of the loop thread over a test tells whether the client is the bottleneck.
+    """
+
+    def __init__(self):
+        self.kind = None
+        self.operations = {}
+        self.current = None
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.kind is not None
+
+    def configure(self, kind):
+        self.kind = kind
+
+    def record(self, operation, elapsed, cpu):
+        """`elapsed` and `cpu` in ms."""
+        if not self.enabled:
+            return
+        cpu = min(cpu, elapsed)
+        with self._lock:
+            totals = self.operations.setdefault(operation, {'count': 0, 'elapsed': 0.0, 'cpu': 0.0})
+            totals['count'] += 1
+            totals['elapsed'] += elapsed
+            totals['cpu'] += cpu
+            if self.current is not None:
+                self.current['operations'].append((operation, round(elapsed, 3), round(cpu, 3)))
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._profiler = SamplingProfiler() if self.kind == 'sampling' else DeterministicProfiler()
+        self._profiler.add_thread(threading.current_thread())
+        self._profiler.add_thread(ws_pool.thread, ws_pool.loop)
+        self.current = {'operations': [], 'wall': time.perf_counter(), 'cpu': time.thread_time(),
+                        'loop_cpu': thread_cpu_time(ws_pool.thread)}
+        self._profiler.start()
+
+    def stop(self, name):
+        if self._profiler is None:
+            return None
+        self._profiler.stop()
+        current = self.current
+        current['wall'] = time.perf_counter() - current['wall']
+        current['cpu'] = time.thread_time() - current['cpu']
+        loop_cpu = thread_cpu_time(ws_pool.thread)
+        current['loop_cpu'] = loop_cpu - current['loop_cpu'] if loop_cpu is not None and current['loop_cpu'] is not None else None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        current['path'] = self._profiler.save(os.path.join(PROFILE_DIR, re.sub(r'[^\w.-]+', '_', name)))
+        self._profiler = None
+        self.current = None
+        return current
+
+    @staticmethod
+    def section(profile):
+        loop = f"{round(profile['loop_cpu'] / profile['wall'] * 100)}%" if profile['loop_cpu'] is not None else '-'
+        lines = [f"test: {round(profile['wall'] * 1000, 1)} ms, test thread CPU {round(profile['cpu'] / profile['wall'] * 100)}%, "
+                 f"event loop thread CPU {loop}, profile: {profile['path']}",
+                 f"{'operation':<32}{'elapsed':>10}{'cpu':>10}{'network':>10}"]
+        for operation, elapsed, cpu in profile['operations']:
+            lines.append(f"{operation:<32}{elapsed:>10.1f}{cpu:>10.1f}{elapsed - cpu:>10.1f}")
+        return "\n".join(lines)
+
+    def summary(self):
+        lines = []
+        for operation, t in sorted(self.operations.items(), key=lambda item: -item[1]['cpu']):
+            lines.append(f"[INFO] '{operation}': {t['count']} operations, avg {round(t['elapsed'] / t['count'], 2)} ms, "
+                         f"client CPU {round(t['cpu'] / t['count'], 2)} ms ({round(t['cpu'] / max(t['elapsed'], 1e-9) * 100)}%), "
+                         f"network wait {round((t['elapsed'] - t['cpu']) / t['count'], 2)} ms")
+        return lines
+
+
+client_profiler = ClientProfiler()
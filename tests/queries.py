@@ -1,89 +1,185 @@
 # ruff: noqa: E501
 import asyncio
-from sys import argv
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from gql.transport.exceptions import TransportQueryError
+from graphql import print_ast
+from time import thread_time
 from timeit import default_timer as timer
-from gql.transport.websockets import WebsocketsTransport
+from .pool import client_pool, ws_pool, http_pool, subscribe, READINESS_PROBE
+from .payloads import registry
+from .metrics import session_recorder
+from .timing import capture_timing, request_timings
+from .cassette import traffic
+from .profiling import client_profiler
+from .sink import metrics_sink
+
+# path to the id that correlates a subscription event with the operation which triggered it
+EVENT_KEYS = {
+    'messageRead': ('message', 'id'),
+    'messageDelivered': ('message', 'id'),
+    'userOnline': ('user', 'apiId'),
+}
+
+
+class EventCorrelator:
+    """
+    Send times of the triggering operations, matched with the subscription events they cause.
+
+    A send time is forgotten once its event has been matched, and the unmatched ones at the end of
+    every test (`reset`).
+    """
+
+    def __init__(self):
+        self.triggers = {}
+
+    def trigger(self, key, sent_at):
+        self.triggers[key] = sent_at
+
+    def reset(self):
+        self.triggers.clear()
+
+    def latency(self, event_name, event, received_at):
+        if event_name not in EVENT_KEYS or not event:
+            return None
+        key = event
+        for field in EVENT_KEYS[event_name]:
+            key = (key or {}).get(field)
+        sent_at = self.triggers.get(key)
+        if sent_at is None or sent_at > received_at:
+            return None
+        del self.triggers[key]
+        return round((received_at - sent_at) * 1000)
+
+
+correlator = EventCorrelator()
 
 
 class Queries:
 
     def execute_gql(self, endpoint, user, headers, raw_body, params=None):
 
-        introspection = True
-        if 'prod' in argv:
-            introspection = False
-
-        headers["Authorization"] = f"Bearer {user['jwt_token']}"
-        with open(raw_body, 'r') as f:
-            request_body = f.read()
-        transport = RequestsHTTPTransport(
-            url=endpoint,
-            use_json=True,
-            headers=headers
-        )
-        client = Client(
-            transport=transport,
-            fetch_schema_from_transport=introspection,
-        )
-        query = gql(request_body)
-        start = timer()
-        result = client.execute(query, variable_values=params)
+        session = client_pool.session(endpoint, user, headers)
+        query = registry[raw_body]
+        start, cpu_start = timer(), thread_time()
+        try:
+            result = session.execute(query, variable_values=params)
+        except Exception as e:
+            if isinstance(e, TransportQueryError):
+                traffic.http(registry.name(raw_body), user['uuid'], print_ast(query), params,
+                             {'data': e.data, 'errors': e.errors}, round((timer() - start) * 1000), start)
+            metrics_sink.operation(registry.name(raw_body), user['uuid'], round((timer() - start) * 1000), 'error')
+            raise
         end = timer()
+        client_profiler.record(registry.name(raw_body), (end - start) * 1000, (thread_time() - cpu_start) * 1000)
         elapsed = round((end - start) * 1000)
+        traffic.http(registry.name(raw_body), user['uuid'], print_ast(query), params, {'data': result}, elapsed, start)
+        timing = session.transport.last_timing
+        timing['phases']['process'] = round(max(0.0, (end - start) * 1000 - sum(timing['phases'].values())), 3)
+        request_timings.add(registry.name(raw_body), timing)
+        client_pool.record(elapsed)
+        session_recorder.record(registry.name(raw_body), elapsed)
+        metrics_sink.operation(registry.name(raw_body), user['uuid'], elapsed, bytes=timing.get('bytes'))
         return result, elapsed
 
 
 class AsyncQueries:
 
-    def create_wss_clients(self, headers, wss_endpoint, user1_auth, user2_auth):
-        introspection = True
-        if 'prod' in argv:
-            introspection = False
-        user1_headers = {**headers, "Authorization": f"Bearer {user1_auth}"}
-        user2_headers = {**headers, "Authorization": f"Bearer {user2_auth}"}
-        user1_transport = WebsocketsTransport(
-            url=wss_endpoint, init_payload=user1_headers, headers=user1_headers)
-        user2_transport = WebsocketsTransport(
-            url=wss_endpoint, init_payload=user2_headers, headers=user2_headers)
-        user1_client = Client(transport=user1_transport,
-                              fetch_schema_from_transport=introspection)
-        user2_client = Client(transport=user2_transport,
-                              fetch_schema_from_transport=introspection)
-        return user1_client, user2_client
-
-    async def execute_async_gql(self, session, tag, raw_body, params=None):
-        with open(raw_body, 'r') as f:
-            request_body = f.read()
-        query = gql(request_body)
-        # delay before sending query, so subscription will be active already
-        await asyncio.sleep(1)
-        start = timer()
-        result = await session.execute(query, variable_values=params)
+    def run(self, coro, timeout=None):
+        return ws_pool.run(coro, timeout)
+
+    async def execute_http(self, endpoint, user, headers, raw_body, params=None):
+        """`Queries.execute_gql` on the pooled async HTTP transport, waiting for a free concurrency slot first."""
+        session = await http_pool.session(endpoint, user, headers)
+        query = registry[raw_body]
+        async with http_pool.slot:
+            timing = capture_timing()
+            start, cpu_start = timer(), thread_time()
+            try:
+                result = await session.execute(query, variable_values=params)
+            except Exception as e:
+                if isinstance(e, TransportQueryError):
+                    traffic.http(registry.name(raw_body), user['uuid'], print_ast(query), params,
+                                 {'data': e.data, 'errors': e.errors}, round((timer() - start) * 1000), start)
+                metrics_sink.operation(registry.name(raw_body), user['uuid'], round((timer() - start) * 1000), 'error')
+                raise
+            end = timer()
+            client_profiler.record(registry.name(raw_body), (end - start) * 1000, (thread_time() - cpu_start) * 1000)
+            elapsed = round((end - start) * 1000)
+        traffic.http(registry.name(raw_body), user['uuid'], print_ast(query), params, {'data': result}, elapsed, start)
+        timing['phases']['process'] = round(max(0.0, (end - start) * 1000 - sum(timing['phases'].values())), 3)
+        request_timings.add(registry.name(raw_body), timing)
+        session_recorder.record(f"{registry.name(raw_body)}.http_async", elapsed)
+        metrics_sink.operation(registry.name(raw_body), user['uuid'], elapsed, bytes=timing.get('bytes'))
+        return result, elapsed
+
+    async def create_wss_sessions(self, headers, wss_endpoint, *users):
+        return [await ws_pool.session(wss_endpoint, user, headers) for user in users]
+
+    async def execute_async_gql(self, session, tag, raw_body, params=None, ready=None, correlation_key=None):
+        query = registry[raw_body]
+        if ready is not None:
+            # the subscription this query triggers has been acknowledged by the server
+            await ready.wait()
+        start, cpu_start = timer(), thread_time()
+        if correlation_key is not None:
+            correlator.trigger(correlation_key, start)
+        try:
+            result = await session.execute(query, variable_values=params)
+        except Exception:
+            metrics_sink.operation(registry.name(raw_body), session.transport.user, round((timer() - start) * 1000), 'error')
+            raise
         end = timer()
+        client_profiler.record(registry.name(raw_body), (end - start) * 1000, (thread_time() - cpu_start) * 1000)
         elapsed = round((end - start) * 1000)
+        session_recorder.record(f"{registry.name(raw_body)}.ws", elapsed)
+        metrics_sink.operation(registry.name(raw_body), session.transport.user, elapsed)
         event_name = list(result.keys())[0]
-        print(
+        metrics_sink.log(
             f"[INFO][{tag}]: '{event_name}' has returned the response: {result[event_name]}")
         return {'response': result, 'elapsed': elapsed}
 
-    async def execute_subscription(self, session, tag, raw_body, n_events, params=None):
-        with open(raw_body, 'r') as f:
-            request_body = f.read()
-        query = gql(request_body)
+    @staticmethod
+    async def acknowledge(session, sent, ready):
+        try:
+            await sent
+            # graphql-ws has no per-operation ack: an answer to a query sent after the 'start' frame
+            # on the same connection means the server has processed the subscription
+            await session.execute(READINESS_PROBE)
+        finally:
+            ready.set()
+
+    async def execute_subscription(self, session, tag, raw_body, n_events, params=None, ready=None):
+        query = registry[raw_body]
         counter = 0
         r = []
+        latency = []
         elapsed = None
+        acknowledgement = None
+        if ready is not None:
+            acknowledgement = asyncio.ensure_future(
+                self.acknowledge(session, session.transport.on_sent(query), ready))
         start = timer()
-        async for result in session.subscribe(query, variable_values=params):
-            end = timer()
-            elapsed = round((end - start) * 1000)
-            event_name = list(result.keys())[0]
-            r.append(result)
-            print(
-                f"[PASSED][{tag}]: Subscription '{event_name}' has returned the response: '{result[event_name]}'")
-            counter += 1
-            if counter >= n_events:
-                break
-        return {'response': r, 'elapsed': elapsed}
+        subscription = subscribe(session, query, variable_values=params)
+        try:
+            async for result in subscription:
+                end = timer()
+                elapsed = round((end - start) * 1000)
+                event_name = list(result.keys())[0]
+                r.append(result)
+                latency.append(correlator.latency(event_name, result[event_name], end))
+                if latency[-1] is not None:
+                    session_recorder.record(f"{event_name}.delivery", latency[-1])
+                metrics_sink.event(event_name, tag, latency[-1])
+                metrics_sink.log(
+                    f"[PASSED][{tag}]: Subscription '{event_name}' has returned the response: '{result[event_name]}', "
+                    f"delivered {latency[-1]} ms after its trigger")
+                counter += 1
+                if counter >= n_events:
+                    break
+        finally:
+            # detach from the pooled connection: sends 'stop' for this operation id only
+            await subscription.aclose()
+            if acknowledgement is not None and not acknowledgement.done():
+                acknowledgement.cancel()
+        if elapsed is not None:
+            session_recorder.record(f"{registry.name(raw_body)}.ws", elapsed)
+        return {'response': r, 'elapsed': elapsed, 'latency': latency}
@@ -0,0 +1,222 @@
+# ruff: noqa: E501
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+from timeit import default_timer as timer
+from aiohttp import web, WSMsgType
+from gql import gql
+from .cassette import NO_RECORDED_RESPONSE
+from .history import mann_whitney_greater
+from .local_server import PERSISTED_QUERY_NOT_FOUND, BackgroundServer
+from .metrics import LatencyRecorder
+from .pool import client_pool
+from .sink import metrics_sink
+from .users import mint_user
+
+PACINGS = ('fast', 'original')
+
+
+class ReplayServer(BackgroundServer):
+    """
+    Serves the traffic of a cassette back to the client (`--replay`), with no GraphQL server.
+
+    HTTP operations and websocket 'start' frames are answered with the recorded responses of the same
+    query, in the recorded order; HTTP operations sent as automatic persisted queries are resolved as
+    the GraphQL server does. A recorded websocket frame is only sent once the client operation that
+    preceded it in the recording has been replayed (e.g. a subscription event after its trigger).
+    With `pacing` 'original' the recorded latencies are reproduced, 'fast' answers at once.
+    """
+    description = 'Replay server'
+
+    def __init__(self, entries, pacing='fast', host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.pacing = pacing
+        self.schema = None
+        self.entries = entries
+        # recorded users by role, e.g. the two users of `create_users` under 'session'
+        self.recorded_users = {}
+        for entry in entries:
+            if entry['kind'] == 'user':
+                self.recorded_users.setdefault(entry.get('role', 'session'), []).append(entry['uuid'])
+        self._http = {}
+        self._starts = {}
+        self._responses = {}
+        self._replayed = {}
+        self._waiters = {}
+        after = None
+        for index, entry in enumerate(entries):
+            if entry['kind'] == 'http':
+                self._http.setdefault(entry['query'], deque()).append(index)
+                after = index
+            elif entry['kind'] == 'ws' and entry['direction'] == 'send' and entry['frame']['type'] == 'start':
+                self._starts.setdefault(entry['frame']['payload']['query'], deque()).append(index)
+                after = index
+            elif entry['kind'] == 'ws' and entry['direction'] == 'recv' and 'id' in entry['frame']:
+                key = (entry['connection'], entry['frame']['id'])
+                self._responses.setdefault(key, []).append((index, after))
+
+    def routes(self, app):
+        app.router.add_post('/graphql', self._http_handler)
+        app.router.add_get('/graphql-ws', self._websocket)
+
+    def _mark_replayed(self, index):
+        self._replayed[index] = timer()
+        waiter = self._waiters.pop(index, None)
+        if waiter is not None:
+            waiter.set()
+
+    async def _after(self, index, at):
+        """Wait for the recorded entry `index` to be replayed, and with original pacing for the time recorded between it and `at`."""
+        if index is None:
+            return
+        if index not in self._replayed:
+            await self._waiters.setdefault(index, asyncio.Event()).wait()
+        if self.pacing == 'original':
+            delay = self._replayed[index] + at - self.entries[index]['t'] - timer()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _http_handler(self, request):
+        body = await request.json()
+        query = self._persisted_query(body)
+        if query is None:
+            return web.json_response(PERSISTED_QUERY_NOT_FOUND)
+        queue = self._http.get(query)
+        if not queue:
+            return web.json_response({'errors': [{'message': NO_RECORDED_RESPONSE}]})
+        index = queue.popleft()
+        self._mark_replayed(index)
+        entry = self.entries[index]
+        if self.pacing == 'original':
+            await asyncio.sleep(entry['elapsed'] / 1000)
+        return web.json_response(entry['response'])
+
+    async def _replay_operation(self, ws, operation_id, start):
+        recorded = self.entries[start]
+        for index, after in self._responses.get((recorded['connection'], recorded['frame']['id']), []):
+            await self._after(after, self.entries[index]['t'])
+            await ws.send_json({**self.entries[index]['frame'], 'id': operation_id})
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse(protocols=('graphql-ws',))
+        await ws.prepare(request)
+        operations = {}
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            message = json.loads(message.data)
+            if message['type'] == 'connection_init':
+                await ws.send_json({'type': 'connection_ack'})
+            elif message['type'] == 'start':
+                queue = self._starts.get(message['payload']['query'])
+                if not queue:
+                    await ws.send_json({'type': 'error', 'id': message['id'],
+                                        'payload': {'message': NO_RECORDED_RESPONSE}})
+                    continue
+                start = queue.popleft()
+                self._mark_replayed(start)
+                operations[message['id']] = asyncio.ensure_future(self._replay_operation(ws, message['id'], start))
+            elif message['type'] == 'stop' and message['id'] in operations:
+                operations.pop(message['id']).cancel()
+                await ws.send_json({'type': 'complete', 'id': message['id']})
+            elif message['type'] == 'connection_terminate':
+                break
+        for operation in operations.values():
+            operation.cancel()
+        await ws.close()
+        return ws
+
+
+class TrafficReplay:
+    """
+    Replays the HTTP operations of a cassette against an environment (`--replay_traffic`) and compares
+    their latency with the recorded one.
+
+    Every operation is sent on behalf of its recorded user, with a JWT minted for the environment.
+    With `pacing` 'original' the operations are sent at their recorded offsets, concurrently when they
+    overlapped; 'fast' sends them one after the other.
+
+    An operation is flagged when its median got slower by more than `threshold` and by more than
+    `min_delta` ms, with a one-sided Mann-Whitney U test below `alpha`: the recorded latencies are
+    rounded to the ms, a few ms faster operations would be flagged on the ratio alone (e.g. 2 -> 4 ms).
+    """
+
+    def __init__(self, env_config, entries, pacing='fast', threshold=0.2, alpha=0.01, min_samples=5, min_delta=5):
+        self.env_config = env_config
+        self.operations = [e for e in entries if e['kind'] == 'http']
+        self.pacing = pacing
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.min_delta = min_delta
+        self.recorded = LatencyRecorder()
+        self.replayed = LatencyRecorder()
+        self._users = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+        for entry in self.operations:
+            self.recorded.record(entry['operation'], entry['elapsed'])
+
+    def _execute(self, entry):
+        if entry['user'] not in self._users:
+            self._users[entry['user']] = mint_user(self.env_config.jwt_key, uuid=entry['user'])
+        user = self._users[entry['user']]
+        if entry['query'] not in self._documents:
+            self._documents[entry['query']] = gql(entry['query'])
+        document = self._documents[entry['query']]
+        session = client_pool.session(self.env_config.graphql_endpoint, user, self.env_config.gql_headers)
+        start = timer()
+        try:
+            session.execute(document, variable_values=entry['variables'])
+        except Exception:
+            with self._lock:
+                self.replayed.error(entry['operation'])
+            metrics_sink.operation(entry['operation'], entry['user'], round((timer() - start) * 1000), 'error')
+            return
+        elapsed = round((timer() - start) * 1000)
+        with self._lock:
+            self.replayed.record(entry['operation'], elapsed)
+        metrics_sink.operation(entry['operation'], entry['user'], elapsed, recorded=entry['elapsed'])
+
+    def run(self):
+        self.replayed.start()
+        if self.pacing == 'fast':
+            for entry in self.operations:
+                self._execute(entry)
+        else:
+            origin = time.monotonic()
+            with ThreadPoolExecutor(max_workers=32) as executor:
+                for entry in self.operations:
+                    delay = origin + entry['t'] - self.operations[0]['t'] - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    executor.submit(self._execute, entry)
+        self.replayed.stop()
+        return self
+
+    def comparison(self):
+        rows = []
+        for operation, histogram in sorted(self.replayed.histograms.items()):
+            current, baseline = list(histogram.values()), list(self.recorded.histograms[operation].values())
+            change = median(current) / median(baseline) - 1 if median(baseline) else 0
+            rows.append({'operation': operation, 'recorded_median': median(baseline), 'replayed_median': median(current),
+                         'samples': min(len(current), len(baseline)), 'change': change, 'p_value': mann_whitney_greater(current, baseline)})
+        return rows
+
+    @property
+    def regressions(self):
+        return [r for r in self.comparison()
+                if r['samples'] >= self.min_samples and r['replayed_median'] - r['recorded_median'] > self.min_delta
+                and r['change'] > self.threshold and r['p_value'] < self.alpha]
+
+    def report(self):
+        lines = [f"[INFO] {self.replayed.total} of {len(self.operations)} recorded operations replayed "
+                 f"({self.pacing} pacing), {self.replayed.total_errors} errors"]
+        for r in self.comparison():
+            lines.append(f"[INFO] '{r['operation']}': median {round(r['recorded_median'])} ms recorded -> "
+                         f"{round(r['replayed_median'])} ms replayed ({round(r['change'] * 100):+}%, p={r['p_value']:.4f})")
+        return lines
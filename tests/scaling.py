@@ -0,0 +1,134 @@
+# ruff: noqa: E501
+from datetime import datetime, timedelta
+from math import log
+from statistics import median
+from timeit import default_timer as timer
+from .factory import DataFactory
+from .queries import Queries
+from .users import mint_user
+
+SCALING_TAG = 'conspector-scaling'
+
+# complexity classes by the exponent k of the power-law fit t ~ n^k, with their upper bound of k:
+# log n grows slower than any power, n log n is between n and n^2 over the usual sizes
+COMPLEXITIES = (
+    ('O(1)', 0.1),
+    ('O(log n)', 0.5),
+    ('O(n)', 1.2),
+    ('O(n log n)', 1.6),
+    ('O(n^2)', float('inf')),
+)
+SUPERLINEAR = ('O(n log n)', 'O(n^2)')
+
+
+def fit_complexity(sizes, latencies, tolerance=0.2):
+    """
+    Complexity class of `latencies` measured at `sizes`, with the exponent `k` of the least-squares
+    fit of `log t = c + k * log n` it is derived from, so that both always agree.
+
+    Latencies growing by less than `tolerance` (relative) or the 1 ms resolution are O(1).
+    """
+    if max(latencies) - min(latencies) <= max(1, tolerance * min(latencies)):
+        return 'O(1)', 0.0
+    logs = [(log(n), log(max(t, 0.001))) for n, t in zip(sizes, latencies)]
+    mean_x, mean_y = sum(x for x, _ in logs) / len(logs), sum(y for _, y in logs) / len(logs)
+    variance = sum((x - mean_x) ** 2 for x, _ in logs)
+    exponent = sum((x - mean_x) * (y - mean_y) for x, y in logs) / variance if variance else 0.0
+    complexity = next(name for name, bound in COMPLEXITIES if exponent < bound)
+    return complexity, exponent
+
+
+class ScalingProfile:
+    """
+    Parsed value of the `--scaling` option, e.g. `sizes=10/100/1000/10000,samples=20`.
+
+    sizes: data volumes the account is grown to, in increasing order: at each size the account holds
+           `size` conversations (a tenth of them tagged), and one of them holds `size` unread messages;
+    samples: executions of each read query at each size.
+    """
+
+    def __init__(self, sizes=(10, 100, 1000), samples=20):
+        self.sizes = sorted(sizes)
+        self.samples = samples
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        unknown = set(options) - {'sizes', 'samples'}
+        if unknown:
+            raise ValueError(f"Unknown scaling options: {sorted(unknown)}")
+        return cls(sizes=[int(size) for size in options.get('sizes', '10/100/1000').split('/')],
+                   samples=int(options.get('samples', 20)))
+
+
+class ScalingBenchmark:
+    """
+    Latency of the read queries of an account as its data volume grows.
+
+    Two fresh users are grown size after size with the `DataFactory`: user1 creates the conversations
+    with user2 and sends the messages of the first one, which user2 has not read. At each size every
+    read query is executed `samples` times by user2, and the complexity class of its median latency
+    over the sizes is fitted: superlinear classes are flagged.
+    """
+
+    def __init__(self, env_config, profile):
+        self.env_config = env_config
+        self.profile = profile
+        self.factory = DataFactory(env_config)
+        self.medians = {}
+        self._queries = Queries()
+
+    def read_queries(self, conversation_id):
+        timestamp = round((datetime.now() - timedelta(hours=24)).timestamp())
+        return {
+            'messagesByConversation': {"conversation_id": conversation_id},
+            'unreadMessages': {"conversation_id": conversation_id},
+            'participantsWithUnreadMessages': {"timestamp": timestamp},
+            'userMeta': None,
+            'conversations': {"tagsFilter": SCALING_TAG},
+        }
+
+    def _grow(self, user1, user2, conversations, messages, size):
+        created = self.factory.create_conversations(user1, [user2['uuid']] * (size - len(conversations)))
+        conversations.extend(c['createConversation']['conversation'] for c in created)
+        tagged = conversations[len(conversations) - len(created):][::10]
+        self.factory.execute(user1, 'addConversationTag', [{"conversationApiId": c['apiId'], "tagName": SCALING_TAG}
+                                                           for c in tagged])
+        sent = self.factory.send_text_messages(user1, [conversations[0]['id']] * (size - messages))
+        return messages + len(sent)
+
+    def run(self):
+        user1 = mint_user(self.env_config.jwt_key, prefix='user-conspector-scaling')
+        user2 = mint_user(self.env_config.jwt_key, prefix='user-conspector-scaling')
+        conversations, messages = [], 0
+        for size in self.profile.sizes:
+            messages = self._grow(user1, user2, conversations, messages, size)
+            for operation, params in self.read_queries(conversations[0]['id']).items():
+                samples = [self._execute(user2, operation, params) for _ in range(self.profile.samples)]
+                self.medians.setdefault(operation, []).append(median(samples))
+        return self
+
+    def _execute(self, user, operation, params):
+        # sub-millisecond precision: the fit is made on small differences between the sizes
+        start = timer()
+        self._queries.execute_gql(endpoint=self.env_config.graphql_endpoint,
+                                  user=user,
+                                  headers=self.env_config.gql_headers,
+                                  raw_body=operation,
+                                  params=params)
+        return (timer() - start) * 1000
+
+    def fits(self):
+        return {operation: fit_complexity(self.profile.sizes, medians) for operation, medians in self.medians.items()}
+
+    @property
+    def superlinear(self):
+        return sorted(operation for operation, (complexity, _) in self.fits().items() if complexity in SUPERLINEAR)
+
+    def report(self):
+        lines = []
+        for operation, (complexity, exponent) in self.fits().items():
+            curve = ", ".join(f"{size}: {round(t, 2)} ms" for size, t in zip(self.profile.sizes, self.medians[operation]))
+            lines.append(f"[INFO] '{operation}': {curve} -> {complexity} (t ~ n^{round(exponent, 2)})"
+                         f"{' SUPERLINEAR' if complexity in SUPERLINEAR else ''}")
+        return lines
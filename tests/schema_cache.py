@@ -0,0 +1,75 @@
+# ruff: noqa: E501
+import os
+import re
+import json
+import hashlib
+from time import time
+from graphql import build_client_schema, get_introspection_query, parse
+from gql.transport.requests import RequestsHTTPTransport
+
+
+class SchemaCache:
+    """
+    Introspection results stored on disk, one file per endpoint.
+
+    The schema is introspected at most once per session and only when the cached copy is
+    missing, older than `ttl` seconds or a refresh is requested. The cache file is rewritten
+    only when the schema hash has changed, the payload documents are then validated offline
+    against the cached schema.
+    """
+
+    def __init__(self, cache_dir='.schema_cache', ttl=24 * 60 * 60):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._schemas = {}
+
+    def _path(self, endpoint):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_')
+        return os.path.join(self.cache_dir, f"{slug}.json")
+
+    @staticmethod
+    def schema_hash(introspection):
+        return hashlib.sha256(json.dumps(introspection, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _fetch(endpoint, headers):
+        transport = RequestsHTTPTransport(url=endpoint, use_json=True, headers=headers)
+        transport.connect()
+        try:
+            result = transport.execute(parse(get_introspection_query()))
+        finally:
+            transport.close()
+        return result.data
+
+    def _read(self, endpoint):
+        try:
+            with open(self._path(endpoint), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, endpoint, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # parallel workers may refresh the same endpoint: replace the file atomically
+        tmp_path = f"{self._path(endpoint)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(endpoint))
+
+    def load(self, endpoint, headers, refresh=False):
+        if endpoint in self._schemas and not refresh:
+            return self._schemas[endpoint]
+        entry = None if refresh else self._read(endpoint)
+        if entry is None or time() - entry['fetched_at'] > self.ttl:
+            introspection = self._fetch(endpoint, headers)
+            schema_hash = self.schema_hash(introspection)
+            if entry is None or entry['hash'] != schema_hash:
+                print(f"[INFO] Schema of '{endpoint}' cached, hash: {schema_hash}")
+            entry = {'endpoint': endpoint, 'hash': schema_hash,
+                     'fetched_at': time(), 'introspection': introspection}
+            self._write(endpoint, entry)
+        self._schemas[endpoint] = build_client_schema(entry['introspection'])
+        return self._schemas[endpoint]
+
+
+schema_cache = SchemaCache()
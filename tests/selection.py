@@ -0,0 +1,194 @@
+# ruff: noqa: E501
+import ast
+import hashlib
+import json
+import os
+import sys
+from contextlib import contextmanager
+from .payloads import PAYLOAD_DIR, registry
+
+INDEX_FILE = 'report/test_index.json'
+RESOURCE_DIR = 'resources'
+CONFTEST = 'tests/conftest.py'
+# dependency key of the code of conftest.py outside of its fixtures (options, hooks), shared by every test
+CONFTEST_HOOKS = 'conftest'
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _is_fixture(node):
+    for decorator in getattr(node, 'decorator_list', []):
+        target = decorator.func if isinstance(decorator, ast.Call) else decorator
+        if getattr(target, 'id', None) == 'fixture' or getattr(target, 'attr', None) == 'fixture':
+            return True
+    return False
+
+
+def local_imports(path, seen=None):
+    """`path` and the modules of its package it imports, directly or not (`from .x import` / `from tests.x import`)."""
+    seen = set() if seen is None else seen
+    if path in seen or not os.path.exists(path):
+        return seen
+    seen.add(path)
+    package_dir = os.path.dirname(path)
+    package = os.path.basename(package_dir)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ImportFrom):
+            continue
+        if node.level == 1:
+            modules = [node.module] if node.module else [alias.name for alias in node.names]
+        elif node.level == 0 and node.module and node.module.startswith(f"{package}."):
+            modules = [node.module[len(package) + 1:]]
+        else:
+            continue
+        for module in modules:
+            local_imports(os.path.join(package_dir, *module.split('.')) + '.py', seen)
+    return seen
+
+
+class DependencyIndex:
+    """
+    Dependencies of every test, with their content hashes when it last ran in an environment, kept in
+    report/test_index.json: a test passed against one environment is not skipped against another one.
+
+    The dependencies of a test are the payloads of resources/gql_payload it reads through the registry and
+    the other files of resources/ it opens (e.g. resources/slo.json, the schema of the local server),
+    directly, in the setup of its fixtures (e.g. the `_fixture_cut` variants) or when its module is
+    imported; the conftest.py fixtures it uses, its module and the modules imported by it and by
+    conftest.py. The reads are recorded as they happen, the fixtures and modules are found in the source.
+
+    A test is affected when one of its dependencies changed since it last ran, when it failed or never
+    ran: `--incremental` runs only these.
+    """
+
+    def __init__(self, path=INDEX_FILE, conftest=CONFTEST):
+        self.path = path
+        self.conftest = conftest
+        self.env = None
+        self.tests = {}
+        self.fixtures = {}
+        self.recorded = {'tests': {}, 'fixtures': {}}
+        self._envs = {}
+        self._failed = set()
+        self._reads = {}
+        self._active = None
+        self._hashes = {}
+        self._modules = {}
+        self._conftest_hashes = None
+
+    def load(self, env):
+        """`env`: environment the tests run against, e.g. 'local' or 'sandbox:mercury.sandbox.starofservice.com'."""
+        try:
+            with open(self.path) as f:
+                self._envs = json.load(f).get('envs', {})
+        except (OSError, ValueError):
+            self._envs = {}
+        self.env = env
+        self.tests = self._envs.get(env, {}).get('tests', {})
+        self.fixtures = self._envs.get(env, {}).get('fixtures', {})
+        sys.addaudithook(self._audit)
+        return self
+
+    def _audit(self, event, args):
+        # files of resources/ opened while a test, a fixture or a module import is tracked
+        if event != 'open' or self._active is None or not isinstance(args[0], str):
+            return
+        path = os.path.relpath(args[0])
+        if path.startswith(RESOURCE_DIR + os.sep) and not path.startswith(PAYLOAD_DIR + os.sep):
+            self._active.add(path)
+
+    def _conftest(self):
+        """Hash of every fixture of conftest.py and of the rest of the file, comments and blank lines aside."""
+        if self._conftest_hashes is None:
+            with open(self.conftest) as f:
+                tree = ast.parse(f.read())
+            hashes = {}
+            for node in [node for node in tree.body if _is_fixture(node)]:
+                hashes[f"fixture:{node.name}"] = hashlib.sha256(ast.dump(node).encode()).hexdigest()
+                tree.body.remove(node)
+            hashes[CONFTEST_HOOKS] = hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+            self._conftest_hashes = hashes
+        return self._conftest_hashes
+
+    def modules(self, path):
+        if path not in self._modules:
+            self._modules[path] = local_imports(path)
+        return self._modules[path]
+
+    def hash(self, key):
+        if key == CONFTEST_HOOKS or key.startswith('fixture:'):
+            return self._conftest().get(key)
+        if key not in self._hashes:
+            self._hashes[key] = file_hash(key)
+        return self._hashes[key]
+
+    def changes(self, nodeid):
+        """Dependencies of the test changed since it last ran, None when it has to run anyway (new or failed)."""
+        entry = self.tests.get(nodeid)
+        if entry is None or entry['failed']:
+            return None
+        return [key for key, value in entry['dependencies'].items() if self.hash(key) != value]
+
+    def affected(self, nodeid):
+        changes = self.changes(nodeid)
+        return changes is None or bool(changes)
+
+    @contextmanager
+    def tracking(self, name):
+        """
+        Records the payloads read through the registry and the files of resources/ opened meanwhile as read
+        by `name`: a test, a fixture or a module.
+        """
+        reads = self._active
+        self._active = registry.reads = self._reads.setdefault(name, set())
+        try:
+            yield
+        finally:
+            self._active = registry.reads = reads
+
+    def fail(self, nodeid):
+        self._failed.add(nodeid)
+
+    def record(self, nodeid, module, fixturenames):
+        fixtures = [name for name in fixturenames if f"fixture:{name}" in self._conftest()]
+        for name in fixtures:
+            if f"fixture:{name}" in self._reads:
+                self.recorded['fixtures'][name] = sorted(self._reads[f"fixture:{name}"])
+        # payload names and paths of the other files of resources/
+        reads = self._reads.get(nodeid, set()) | self._reads.get(f"module:{module}", set())
+        for name in fixtures:
+            reads.update(self.recorded['fixtures'].get(name, self.fixtures.get(name, ())))
+        keys = self.modules(module) | (self.modules(self.conftest) - {self.conftest})
+        keys.update(registry.paths.get(read, read) for read in reads if read in registry.paths or os.sep in read)
+        keys.update(f"fixture:{name}" for name in fixtures)
+        keys.add(CONFTEST_HOOKS)
+        self.recorded['tests'][nodeid] = {'dependencies': {key: self.hash(key) for key in sorted(keys)},
+                                          'failed': nodeid in self._failed}
+
+    def merge(self, recorded):
+        """Adds the tests recorded by a pytest-xdist worker."""
+        self.recorded['tests'].update(recorded['tests'])
+        self.recorded['fixtures'].update(recorded['fixtures'])
+
+    def save(self):
+        if not self.recorded['tests']:
+            return
+        self.tests.update(self.recorded['tests'])
+        self.fixtures.update(self.recorded['fixtures'])
+        self._envs[self.env] = {'tests': self.tests, 'fixtures': self.fixtures}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'envs': self._envs}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+dependency_index = DependencyIndex()
@@ -0,0 +1,145 @@
+# ruff: noqa: E501
+import glob
+import json
+import os
+import random
+import sys
+import threading
+from time import time
+from .metrics import Histogram, PERCENTILES
+from .users import worker_path
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:  # the standard encoder, slower on large batches
+    def json_dumps(value):
+        return json.dumps(value, separators=(',', ':')).encode()
+
+SINK_FILE = 'report/metrics.jsonl'
+
+
+class MetricsSink:
+    """
+    Operations and subscription events of the session as JSON lines (`--metrics_sink`), written in batches.
+
+    `operation` and `event` only append a dict to an in-memory buffer; the buffer is serialized and written
+    in one call every `batch` records and on `close`, so that the hot paths neither format nor write text.
+    Without a path nothing is recorded.
+
+    The human-readable lines of the tests go through `log`, printed for a `sample` share of them: all of
+    them by default, none when the sink is written unless `--log_sample` is given.
+    """
+
+    def __init__(self, batch=1000):
+        self.batch = batch
+        self.path = None
+        self.sample = 1.0
+        self.written = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def configure(self, path=None, sample=None, worker=None):
+        self.path = worker_path(path, worker) if path else None
+        self.sample = sample if sample is not None else 0.0 if path else 1.0
+        if path and worker is None:
+            # records of a previous session, its workers included
+            for stale in [path, *glob.glob(worker_path(path, 'gw*'))]:
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    def _append(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.batch
+        if full:
+            self.flush()
+
+    def operation(self, name, user, elapsed, outcome='ok', **fields):
+        """`elapsed` in ms; `fields`, e.g. the `bytes` of the request timing."""
+        if self.enabled:
+            self._append({'type': 'operation', 'ts': time(), 'operation': name, 'user': user,
+                          'elapsed': elapsed, 'outcome': outcome, **fields})
+
+    def event(self, name, tag, latency=None):
+        """Subscription event received by `tag`, `latency` (ms) from its trigger when known."""
+        if self.enabled:
+            self._append({'type': 'event', 'ts': time(), 'event': name, 'tag': tag, 'latency': latency})
+
+    def log(self, line):
+        if self.sample >= 1 or (self.sample > 0 and random.random() < self.sample):
+            print(line)
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        with self._write_lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(b'\n'.join(json_dumps(record) for record in records) + b'\n')
+            self.written += len(records)
+
+    def close(self):
+        if self.enabled:
+            self.flush()
+
+
+def read_records(paths):
+    for path in paths:
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def summarize(paths):
+    """Report lines of the operations and events recorded in the sink files `paths`."""
+    operations, events, users, errors, sizes, received = {}, {}, set(), {}, {}, {}
+    for record in read_records(paths):
+        if record['type'] == 'operation':
+            name = record['operation']
+            users.add(record['user'])
+            if record['outcome'] != 'ok':
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            operations.setdefault(name, Histogram()).record(record['elapsed'])
+            if record.get('bytes'):
+                size = sizes.setdefault(name, [0, 0, 0])
+                size[0] += 1
+                size[1] += record['bytes']['request']
+                size[2] += record['bytes']['wire']
+        elif record['type'] == 'event':
+            name = record['event']
+            received[name] = received.get(name, 0) + 1
+            # events not correlated with their trigger have no latency
+            histogram = events.setdefault(name, Histogram())
+            if record['latency'] is not None:
+                histogram.record(record['latency'])
+    lines = [f"[INFO] metrics sink: {sum(h.count for h in operations.values())} operations of {len(users)} users, "
+             f"{sum(errors.values())} errors, {sum(received.values())} events"]
+    for name in sorted(set(operations) | set(errors)):
+        histogram = operations.get(name, Histogram())
+        percentiles = "/".join(str(histogram.percentile(p)) for p in PERCENTILES)
+        size = sizes.get(name)
+        size = f", avg request {round(size[1] / size[0])} B, response {round(size[2] / size[0])} B on the wire" if size else ''
+        lines.append(f"[INFO] '{name}': {histogram.count} ok, {errors.get(name, 0)} errors, "
+                     f"p{'/p'.join(map(str, PERCENTILES))} {percentiles} ms{size}")
+    for name, histogram in sorted(events.items()):
+        percentiles = "/".join(str(histogram.percentile(p)) for p in PERCENTILES)
+        lines.append(f"[INFO] '{name}' events: {received[name]}, "
+                     f"delivery p{'/p'.join(map(str, PERCENTILES))} {percentiles} ms")
+    return lines
+
+
+metrics_sink = MetricsSink()
+
+if __name__ == '__main__':
+    # python -m tests.sink report/metrics*.jsonl
+    for report_line in summarize(sys.argv[1:] or [SINK_FILE]):
+        print(report_line)
@@ -0,0 +1,68 @@
+# ruff: noqa: E501
+import json
+import asyncio
+from .metrics import Histogram
+
+SLO_FILE = 'resources/slo.json'
+
+
+class SLO:
+    """
+    Latency objective of one operation: `percentile` of `samples` executions over `path` must be =< `budget_ms`.
+
+    `concurrency`: executions in flight at the same time on the 'http_async' path, all of them when not given.
+    """
+
+    def __init__(self, operation, budget_ms, percentile=95, samples=50, path='http', concurrency=None):
+        self.operation = operation
+        self.budget_ms = budget_ms
+        self.percentile = percentile
+        self.samples = samples
+        self.path = path
+        self.concurrency = concurrency
+
+    @property
+    def id(self):
+        return f"{self.operation}-{self.path}"
+
+    def __repr__(self):
+        return f"'{self.operation}' ({self.path}) p{self.percentile} =< {self.budget_ms} ms over {self.samples} samples"
+
+    def sample(self, execute):
+        histogram = Histogram()
+        for _ in range(self.samples):
+            histogram.record(execute())
+        return histogram
+
+    async def sample_async(self, execute):
+        histogram = Histogram()
+        for _ in range(self.samples):
+            histogram.record(await execute())
+        return histogram
+
+    async def sample_concurrent(self, execute):
+        """
+        The `samples` executions `concurrency` at a time, e.g. with 'AsyncQueries.execute_http'. The time an
+        execution waits for its turn is not part of its latency: the SLO measures the server under a steady
+        concurrency, not the queue of the burst.
+        """
+        histogram = Histogram()
+        in_flight = asyncio.Semaphore(self.concurrency or self.samples)
+
+        async def bounded():
+            async with in_flight:
+                return await execute()
+        for elapsed in await asyncio.gather(*[bounded() for _ in range(self.samples)]):
+            histogram.record(elapsed)
+        return histogram
+
+    def check(self, histogram):
+        value = histogram.percentile(self.percentile)
+        assert value is not None and value <= self.budget_ms, \
+            f"SLO {self} failed: p{self.percentile} = {value} ms\n{histogram.distribution()}"
+        return value
+
+
+def load_slos(path=SLO_FILE):
+    with open(path, 'r') as f:
+        return [SLO(**entry) for entry in json.load(f)]
@@ -0,0 +1,267 @@
+# ruff: noqa: E501
+import asyncio
+import os
+import resource
+from datetime import timedelta
+from timeit import default_timer as timer
+from .load import parse_duration
+from .metrics import LatencyRecorder, slope
+from .payloads import registry
+from .pool import subscribe, ws_pool
+from .queries import AsyncQueries
+from .sink import metrics_sink
+from .users import mint_user
+
+# key of an event, matched with the operation which triggered it
+SOAK_EVENTS = {
+    'userOnline': lambda e: e['user']['apiId'],
+    'messageRead': lambda e: e['message']['id'],
+}
+# validity of the JWTs of the virtual users beyond the run: setup, drain and reconnections near the deadline
+TOKEN_MARGIN = timedelta(minutes=10)
+
+
+def process_resources():
+    """Resident memory (MB) and open file descriptors of the client process, None when not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # peak instead of current resident memory (kB on Linux, bytes on macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        fds = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        fds = None
+    return round(rss, 1), fds
+
+
+class SoakProfile:
+    """
+    Parsed value of the `--soak` option, e.g. `users=50,duration=4h,window=5m,think=2s,heartbeat=30s`.
+
+    users: virtual users kept alive for the whole run, paired two by two in conversations;
+    duration: length of the run;
+    window: time window of the latency percentiles, reconnections, dropped events and process resources;
+    think: pause between two messages of a virtual user;
+    heartbeat: interval of the 'lastSeen' heartbeats of a virtual user;
+    event_timeout: time after which an expected subscription event is counted as dropped;
+    drift: relative growth of a windowed p95 over the run (least-squares trend) flagged as a drift.
+    """
+
+    def __init__(self, users=10, duration=3600.0, window=60.0, think=1.0, heartbeat=10.0, event_timeout=30.0, drift=0.2):
+        self.users = users + users % 2
+        self.duration = duration
+        self.window = window
+        self.think = think
+        self.heartbeat = heartbeat
+        self.event_timeout = event_timeout
+        self.drift = drift
+
+    @classmethod
+    def parse(cls, value):
+        options = dict(item.split('=', 1) for item in value.split(',') if item)
+        unknown = set(options) - {'users', 'duration', 'window', 'think', 'heartbeat', 'event_timeout', 'drift'}
+        if unknown:
+            raise ValueError(f"Unknown soak options: {sorted(unknown)}")
+        return cls(users=int(options.get('users', 10)),
+                   duration=parse_duration(options.get('duration', '1h')),
+                   window=parse_duration(options.get('window', '60s')),
+                   think=parse_duration(options.get('think', '1s')),
+                   heartbeat=parse_duration(options.get('heartbeat', '10s')),
+                   event_timeout=parse_duration(options.get('event_timeout', '30s')),
+                   drift=float(options.get('drift', 0.2)))
+
+
+class SoakRunner:
+    """
+    Keeps a population of paired virtual users alive on the event loop of the websocket pool for hours.
+
+    Every virtual user holds 'userOnline' and 'messageRead' subscriptions on its pooled connection,
+    sends 'lastSeen' heartbeats, sends messages to its partner and marks the partner's messages as read.
+    Each heartbeat and read is expected to reach the partner's subscription: events not received after
+    `event_timeout` are dropped. A subscription ended by a lost connection, or which failed to open, is
+    re-opened on a new one until the end of the run.
+
+    Every `window` the latency percentiles of the operations and of the event delivery, the websocket
+    reconnections, the dropped events and the memory and file descriptors of the process are snapshot.
+    A p95 whose trend over the windows grows by more than `drift` is flagged, and so are the file
+    descriptors when they keep growing.
+    """
+
+    def __init__(self, env_config, profile):
+        self.env_config = env_config
+        self.profile = profile
+        self.windows = []
+        self.resubscriptions = 0
+        self._recorder = LatencyRecorder()
+        self._expected = {}
+        self._dropped = 0
+        self._reconnects = 0
+        self._inboxes = {}
+
+    async def _execute(self, session, operation, params=None):
+        start = timer()
+        try:
+            result = await session.execute(registry[operation], variable_values=params)
+        except Exception:
+            self._recorder.error(operation)
+            metrics_sink.operation(operation, session.transport.user, round((timer() - start) * 1000, 3), 'error')
+            return None
+        elapsed = (timer() - start) * 1000
+        self._recorder.record(operation, elapsed)
+        metrics_sink.operation(operation, session.transport.user, round(elapsed, 3))
+        return result
+
+    async def _trigger(self, session, operation, subscriber, event_name, key, params=None):
+        """Executes `operation`, expecting its event on the subscription of `subscriber` unless it failed (an error, not a dropped event)."""
+        expectation = (subscriber['uuid'], event_name, key)
+        # registered before the operation is sent: the event may arrive before its response
+        self._expected[expectation] = timer()
+        result = await self._execute(session, operation, params)
+        if result is None:
+            self._expected.pop(expectation, None)
+        return result
+
+    async def _subscription(self, user, event_name, params, ready, deadline):
+        while timer() < deadline:
+            acknowledgement = subscription = None
+            try:
+                session = await ws_pool.session(self.env_config.wss_endpoint, user, self.env_config.gql_headers)
+                acknowledgement = asyncio.ensure_future(
+                    AsyncQueries.acknowledge(session, session.transport.on_sent(registry[event_name]), ready))
+                subscription = subscribe(session, registry[event_name], variable_values=params)
+                async for result in subscription:
+                    sent_at = self._expected.pop((user['uuid'], event_name, SOAK_EVENTS[event_name](result[event_name])), None)
+                    latency = None if sent_at is None else (timer() - sent_at) * 1000
+                    if latency is not None:
+                        self._recorder.record(f"{event_name}.delivery", latency)
+                    metrics_sink.event(event_name, user['uuid'], None if latency is None else round(latency, 3))
+            except Exception:
+                # failed connection, rejected 'start' frame or lost connection: retried until the deadline
+                self._recorder.error(f"{event_name}.subscription")
+            finally:
+                if subscription is not None:
+                    await subscription.aclose()
+                if acknowledgement is not None:
+                    acknowledgement.cancel()
+                # a subscription which failed before its acknowledgement does not hold the start of the run
+                ready.set()
+            if timer() < deadline:
+                self.resubscriptions += 1
+                await asyncio.sleep(1)
+
+    async def _virtual_user(self, user, partner, conversation_id, deadline):
+        last_heartbeat = 0
+        while timer() < deadline:
+            try:
+                session = await ws_pool.session(self.env_config.wss_endpoint, user, self.env_config.gql_headers)
+            except Exception:
+                self._recorder.error('connection')
+                await asyncio.sleep(self.profile.think)
+                continue
+            if timer() - last_heartbeat >= self.profile.heartbeat:
+                last_heartbeat = timer()
+                await self._trigger(session, 'lastSeen', partner, 'userOnline', user['uuid'])
+            result = await self._execute(session, 'sendTextMessage',
+                                         {"conversation_id": conversation_id, "message": f"Soak message from {user['uuid']}"})
+            if result is not None:
+                self._inboxes[partner['uuid']].append(result['sendTextMessage']['message']['id'])
+            inbox = self._inboxes[user['uuid']]
+            while inbox:
+                message_id = inbox.pop(0)
+                await self._trigger(session, 'markAsRead', partner, 'messageRead', message_id, {"message_id": message_id})
+            await asyncio.sleep(self.profile.think)
+
+    def _snapshot(self, started):
+        now = timer()
+        expired = [key for key, sent_at in self._expected.items() if now - sent_at > self.profile.event_timeout]
+        for key in expired:
+            del self._expected[key]
+        self._dropped += len(expired)
+        rss, fds = process_resources()
+        reconnects, self._reconnects = self._reconnects, ws_pool.reconnects
+        recorder, self._recorder = self._recorder, LatencyRecorder()
+        self.windows.append({
+            'at': round(now - started),
+            'p95': {operation: h.percentile(95) for operation, h in recorder.histograms.items()},
+            'p50': {operation: h.percentile(50) for operation, h in recorder.histograms.items()},
+            'operations': sum(h.count for h in recorder.histograms.values()),
+            'errors': recorder.total_errors,
+            'dropped': len(expired),
+            'reconnects': ws_pool.reconnects - reconnects,
+            'rss_mb': rss,
+            'fds': fds,
+        })
+
+    async def _sample(self, started, deadline):
+        while timer() < deadline:
+            await asyncio.sleep(min(self.profile.window, max(0.0, deadline - timer())))
+            self._snapshot(started)
+
+    async def run(self):
+        # the tokens outlive the run: reconnections and re-subscriptions authenticate with them for hours
+        ttl = timedelta(seconds=self.profile.duration) + TOKEN_MARGIN
+        users = [mint_user(self.env_config.jwt_key, prefix=f'user-conspector-soak{i}', ttl=ttl) for i in range(self.profile.users)]
+        conversations = []
+        for user, partner in zip(users[0::2], users[1::2]):
+            session = await ws_pool.session(self.env_config.wss_endpoint, user, self.env_config.gql_headers)
+            result = await session.execute(registry['createConversation_fixture_cut'], variable_values={"participant": partner['uuid']})
+            conversations.append(result['createConversation']['conversation']['id'])
+        self._inboxes = {user['uuid']: [] for user in users}
+        deadline = timer() + self.profile.duration
+        ready = []
+        tasks = []
+        for i, user in enumerate(users):
+            for event_name, params in (('userOnline', {"conversation_id": [conversations[i // 2]]}), ('messageRead', None)):
+                ready.append(asyncio.Event())
+                tasks.append(asyncio.ensure_future(self._subscription(user, event_name, params, ready[-1], deadline)))
+        await asyncio.gather(*[r.wait() for r in ready])
+        started = timer()
+        self._reconnects = ws_pool.reconnects
+        tasks.extend(asyncio.ensure_future(self._virtual_user(user, users[i ^ 1], conversations[i // 2], deadline))
+                     for i, user in enumerate(users))
+        await self._sample(started, deadline)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self
+
+    @staticmethod
+    def _trend(values):
+        """Relative growth of the least-squares trend of `values` from the first to the last window."""
+        values = [v for v in values if v is not None]
+        if len(values) < 3:
+            return 0.0
+        trend = slope(values)
+        first = sum(values) / len(values) - trend * (len(values) - 1) / 2
+        return trend * (len(values) - 1) / first if first > 0 else 0.0
+
+    @property
+    def drifts(self):
+        operations = sorted({operation for w in self.windows for operation in w['p95']})
+        drifts = {operation: self._trend([w['p95'].get(operation) for w in self.windows]) for operation in operations}
+        return {operation: drift for operation, drift in drifts.items() if drift > self.profile.drift}
+
+    @property
+    def leaks(self):
+        fds = [w['fds'] for w in self.windows if w['fds'] is not None]
+        return {'fds': fds[-1] - fds[0]} if len(fds) >= 3 and self._trend(fds) > self.profile.drift else {}
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def report(self):
+        lines = [f"[INFO] soak of {self.profile.users} users for {self.profile.duration} s: {len(self.windows)} windows, "
+                 f"{self.dropped} dropped events, {ws_pool.reconnects} reconnections, {self.resubscriptions} re-subscriptions"]
+        for w in self.windows:
+            p95 = ", ".join(f"{operation}: {value}" for operation, value in sorted(w['p95'].items()))
+            lines.append(f"[INFO] +{w['at']} s: {w['operations']} ops, {w['errors']} errors, {w['dropped']} dropped, "
+                         f"{w['reconnects']} reconnections, "
+                         f"rss {w['rss_mb']} MB, {w['fds']} fds, p95 (ms) {p95}")
+        for operation, drift in self.drifts.items():
+            lines.append(f"[DRIFT] '{operation}': p95 +{round(drift * 100)}% over the run")
+        for resource_name, growth in self.leaks.items():
+            lines.append(f"[LEAK] {resource_name}: +{growth} over the run")
+        return lines
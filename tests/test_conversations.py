@@ -2,6 +2,7 @@
 from pytest import mark
 from datetime import datetime, timedelta
 from tests.queries import Queries
+from tests.sink import metrics_sink
 
 
 @mark.conversations
@@ -45,8 +46,8 @@ class ConversationTests:
                    for participant in result[event_name]['conversation']['participants']['edges']
                    ), f"Users '{user1['uuid']}' or '{user2['uuid']}' not found in participants"
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] Conversation created: {result[event_name]['conversation']['id']}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] Conversation created: {result[event_name]['conversation']['id']}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.get_conversations
     def test_as_a_participant_i_want_to_get_all_my_conversations(self, env_config, create_users, create_conversation):
@@ -90,8 +91,8 @@ class ConversationTests:
         assert not result[event_name]['pageInfo']['hasNextPage']
         assert not result[event_name]['pageInfo']['hasPreviousPage']
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] Conversation fetched: {conversation_id}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] Conversation fetched: {conversation_id}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.conversations_with
     def test_as_a_participant_i_want_to_get_all_my_conversations_with_specific_participants(self, env_config,
@@ -130,8 +131,8 @@ class ConversationTests:
                         break
         assert is_param_found
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] Conversation fetched: {conversation_id}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] Conversation fetched: {conversation_id}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.add_conversation_tag
     def test_as_a_participant_i_want_to_add_conversation_tag(self, env_config, create_users, create_conversation):
@@ -162,7 +163,7 @@ class ConversationTests:
                                          raw_body=f'resources/gql_payload/mutations/{event_name}.graphql',
                                          params=params)
         assert elapsed <= env_config.time_assert
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
         # Assert tag has been added :
         event_name = 'conversations'
@@ -179,7 +180,7 @@ class ConversationTests:
                 assert result[event_name]['edges'][e]['node']['creator']['apiId'] == user1['uuid']
                 assert result[event_name]['edges'][e]['node']['tags'] == ['conspector']
                 break
-        print(f"[PASSED] Conversation with tag 'conspector' found: {conversation_id}")
+        metrics_sink.log(f"[PASSED] Conversation with tag 'conspector' found: {conversation_id}")
 
     @mark.remove_conversation_tag
     def test_as_a_participant_i_want_to_remove_conversation_tag(self, env_config, create_users, create_conversation):
@@ -210,7 +211,7 @@ class ConversationTests:
                                          raw_body=f'resources/gql_payload/mutations/{event_name}.graphql',
                                          params=params)
         assert elapsed <= env_config.time_assert
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
         # Assert tag has been removed :
         event_name = 'conversations'
@@ -221,4 +222,4 @@ class ConversationTests:
                                         raw_body=f'resources/gql_payload/queries/{event_name}.graphql',
                                         params=params)
         assert len(result[event_name]['edges']) == 0
-        print("[PASSED] Conversation with tag 'conspector' not found")
+        metrics_sink.log("[PASSED] Conversation with tag 'conspector' not found")
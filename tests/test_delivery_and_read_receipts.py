@@ -3,6 +3,7 @@ import asyncio
 import backoff
 from pytest import mark, fail
 from tests.queries import Queries, AsyncQueries
+from tests.sink import metrics_sink
 
 
 @mark.delivery_read_receipts
@@ -35,7 +36,7 @@ class DeliveryReadReceiptsTests:
             'apiId']
         message_id = send_text_message['sendTextMessage']['message']['id']
         assert recipient == user2['uuid']
-        print(f"[PASSED] Message '{message_id}' received by {recipient}")
+        metrics_sink.log(f"[PASSED] Message '{message_id}' received by {recipient}")
 
     @mark.mark_as_read
     def test_as_a_participant_i_want_to_let_others_know_that_i_have_read_a_message(self, env_config, create_users,
@@ -61,8 +62,8 @@ class DeliveryReadReceiptsTests:
         assert result[event_name]['message']['id'] == message_id
         assert result[event_name]['message']['readBy'][0]['apiId'] == user2['uuid']
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] Message '{message_id}' is read by {user2['uuid']}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] Message '{message_id}' is read by {user2['uuid']}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.message_delivered
     def test_as_a_participant_i_want_to_know_when_my_message_is_delivered_to_someone(self, env_config, create_users,
@@ -85,39 +86,40 @@ class DeliveryReadReceiptsTests:
 
         @backoff.on_exception(backoff.expo, Exception, max_time=5)
         async def graphql_connection():
-            user1_client, user2_client = async_query.create_wss_clients(
-                headers=env_config.gql_headers,
-                wss_endpoint=env_config.wss_endpoint,
-                user1_auth=f"{user1['jwt_token']}",
-                user2_auth=f"{user2['jwt_token']}")
-            async with user1_client as user1_session, user2_client as user2_session:
-                task1 = asyncio.create_task(
-                    async_query.execute_subscription(
-                        session=user1_session,
-                        tag='user1',
-                        raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
-                        n_events=1))
-                task2 = asyncio.create_task(
-                    async_query.execute_async_gql(
-                        session=user2_session,
-                        tag='user2',
-                        raw_body='resources/gql_payload/queries/messagesByConversation.graphql',
-                        params={"conversation_id": conversation_id}))
-                try:
-                    r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
-                except asyncio.TimeoutError:
-                    fail("Subscription got no events!")
+            user1_session, user2_session = await async_query.create_wss_sessions(
+                env_config.gql_headers, env_config.wss_endpoint, user1, user2)
+            ready = asyncio.Event()
+            task1 = asyncio.create_task(
+                async_query.execute_subscription(
+                    session=user1_session,
+                    tag='user1',
+                    raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
+                    n_events=1,
+                    ready=ready))
+            task2 = asyncio.create_task(
+                async_query.execute_async_gql(
+                    session=user2_session,
+                    tag='user2',
+                    raw_body='resources/gql_payload/queries/messagesByConversation.graphql',
+                    params={"conversation_id": conversation_id},
+                    ready=ready,
+                    correlation_key=message_id))
+            try:
+                r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
+            except asyncio.TimeoutError:
+                fail("Subscription got no events!")
             return r[0], r[1]
-        r_task1, r_task2 = asyncio.run(graphql_connection())
+        r_task1, r_task2 = async_query.run(graphql_connection())
         # ---- ASSERTIONS ---- :
         assert r_task1['response'][0][event_name]['message']['id'] == message_id
         assert r_task1['response'][0][event_name]['recipient']['apiId'] == user2['uuid']
         assert r_task2['response']['messagesByConversation']['edges'][0]['node']['id'] == message_id
         assert r_task2['response']['messagesByConversation']['edges'][0]['node']['body'] == "This is my text message"
-        assert r_task1['elapsed'] <= env_config.time_assert
-        print(
-            f"[INFO] 'messageDelivered' elapsed time: {r_task1['elapsed']} ms")
-        print(
+        assert r_task1['latency'][0] is not None, "'messageDelivered' event not correlated with its trigger"
+        assert r_task1['latency'][0] <= env_config.time_assert
+        metrics_sink.log(
+            f"[INFO] 'messageDelivered' delivery latency: {r_task1['latency'][0]} ms")
+        metrics_sink.log(
             f"[INFO] 'messagesByConversation' elapsed time: {r_task2['elapsed']} ms")
 
     @mark.message_read
@@ -140,39 +142,40 @@ class DeliveryReadReceiptsTests:
 
         @backoff.on_exception(backoff.expo, Exception, max_time=5)
         async def graphql_connection():
-            user1_client, user2_client = async_query.create_wss_clients(
-                headers=env_config.gql_headers,
-                wss_endpoint=env_config.wss_endpoint,
-                user1_auth=f"{user1['jwt_token']}",
-                user2_auth=f"{user2['jwt_token']}")
-            async with user1_client as user1_session, user2_client as user2_session:
-                task1 = asyncio.create_task(
-                    async_query.execute_subscription(
-                        session=user1_session,
-                        tag='user1',
-                        raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
-                        n_events=1))
-                task2 = asyncio.create_task(
-                    async_query.execute_async_gql(
-                        session=user2_session,
-                        tag='user2',
-                        raw_body='resources/gql_payload/mutations/markAsRead.graphql',
-                        params={"message_id": message_id}))
-                try:
-                    r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
-                except asyncio.TimeoutError:
-                    fail("Subscription got no events!")
+            user1_session, user2_session = await async_query.create_wss_sessions(
+                env_config.gql_headers, env_config.wss_endpoint, user1, user2)
+            ready = asyncio.Event()
+            task1 = asyncio.create_task(
+                async_query.execute_subscription(
+                    session=user1_session,
+                    tag='user1',
+                    raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
+                    n_events=1,
+                    ready=ready))
+            task2 = asyncio.create_task(
+                async_query.execute_async_gql(
+                    session=user2_session,
+                    tag='user2',
+                    raw_body='resources/gql_payload/mutations/markAsRead.graphql',
+                    params={"message_id": message_id},
+                    ready=ready,
+                    correlation_key=message_id))
+            try:
+                r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
+            except asyncio.TimeoutError:
+                fail("Subscription got no events!")
             return r[0], r[1]
 
-        r_task1, r_task2 = asyncio.run(graphql_connection())
+        r_task1, r_task2 = async_query.run(graphql_connection())
         # ---- ASSERTIONS ---- :
         assert r_task1['response'][0][event_name]['message']['id'] == message_id
         assert r_task1['response'][0][event_name]['reader']['apiId'] == user2['uuid']
         assert r_task2['response']['markAsRead']['message']['id'] == message_id
         assert r_task2['response']['markAsRead']['message']['readBy'][0]['apiId'] == user2['uuid']
-        assert r_task1['elapsed'] <= env_config.time_assert
-        print(f"[INFO] 'messageRead' elapsed time: {r_task1['elapsed']} ms")
-        print(f"[INFO] 'markAsRead' elapsed time: {r_task2['elapsed']} ms")
+        assert r_task1['latency'][0] is not None, "'messageRead' event not correlated with its trigger"
+        assert r_task1['latency'][0] <= env_config.time_assert
+        metrics_sink.log(f"[INFO] 'messageRead' delivery latency: {r_task1['latency'][0]} ms")
+        metrics_sink.log(f"[INFO] 'markAsRead' elapsed time: {r_task2['elapsed']} ms")
 
     @mark.unread_messages
     def test_as_a_participant_i_want_to_get_my_unread_messages(self, env_config, create_users, create_conversation,
@@ -204,5 +207,5 @@ class DeliveryReadReceiptsTests:
         assert result[event_name]['edges'][0]['node']['id'] == message_id
         assert result[event_name]['edges'][0]['node']['body'] == "This is my text message"
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] Got unread message: {message_id}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] Got unread message: {message_id}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
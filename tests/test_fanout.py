@@ -0,0 +1,30 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.fanout import FanoutProfile, FanoutScenario
+from tests.pool import ws_pool
+
+
+@mark.fanout
+class SubscriptionFanoutTests:
+
+    @mark.parametrize('event_name', ['userOnline', 'messageRead', 'messageDelivered'])
+    def test_as_a_system_i_want_to_broadcast_events_to_every_participant(self, request, env_config, event_name):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--fanout`):
+        1. Mint `participants` users and create a conversation between all of them;
+        2. Every participant subscribes to `event_name`;
+        3. `burst` participants fire the triggering operation at the same time;
+        4. Report delivery latency distribution and events/s;
+        5. Assert every participant received each event exactly once.
+
+        """
+        profile = FanoutProfile.parse(request.config.getoption('--fanout'))
+        scenario = ws_pool.run(FanoutScenario(env_config, profile, event_name).run())
+        for line in scenario.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert scenario.triggered
+        assert not scenario.missing, f"{len(scenario.missing)} subscribers missed events"
+        assert not scenario.duplicated, f"{len(scenario.duplicated)} subscribers received duplicated events"
@@ -0,0 +1,105 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.queries import Queries, AsyncQueries
+from tests.sink import metrics_sink
+from tests.slo import load_slos
+
+SLOS = load_slos()
+
+
+def operation_params(operation, users, conversation_id, message_id):
+    user1, user2 = users
+    return {
+        'lastSeen': (user1, None),
+        'userMeta': (user1, None),
+        'markAsRead': (user2, {"message_id": message_id}),
+        'sendTextMessage': (user1, {"conversation_id": conversation_id, "message": "This is my text message"}),
+        'conversations': (user1, {"tagsFilter": "-"}),
+        'unreadMessages': (user2, {"conversation_id": conversation_id}),
+        'messagesByConversation': (user2, {"conversation_id": conversation_id}),
+    }[operation]
+
+
+@mark.slo
+class LatencySLOTests:
+
+    @mark.slo_http
+    @mark.parametrize('slo', [s for s in SLOS if s.path == 'http'], ids=lambda s: s.id)
+    def test_as_a_system_i_want_http_operations_to_meet_their_slo(self, slo, env_config, slo_conversation):
+        """
+        TEST CASE:
+        1. Create 2 users dedicated to the SLOs, a conversation and a message (`slo_conversation`);
+        2. Execute the operation `samples` times with 'Queries.execute_gql';
+        3. Assert the `percentile` of the latency distribution is =< `budget_ms` (resources/slo.json).
+
+        """
+        q = Queries()
+        user, params = operation_params(slo.operation, slo_conversation['users'], slo_conversation['conversation_id'],
+                                        slo_conversation['message_id'])
+
+        def execute():
+            _, elapsed = q.execute_gql(endpoint=env_config.graphql_endpoint,
+                                       user=user,
+                                       headers=env_config.gql_headers,
+                                       raw_body=slo.operation,
+                                       params=params)
+            return elapsed
+        histogram = slo.sample(execute)
+        # ---- ASSERTIONS ---- :
+        value = slo.check(histogram)
+        metrics_sink.log(f"[PASSED] SLO {slo}: p{slo.percentile} = {value} ms")
+
+    @mark.slo_http_async
+    @mark.parametrize('slo', [s for s in SLOS if s.path == 'http_async'], ids=lambda s: s.id)
+    def test_as_a_system_i_want_concurrent_http_operations_to_meet_their_slo(self, slo, env_config, slo_conversation):
+        """
+        TEST CASE:
+        1. Create 2 users dedicated to the SLOs, a conversation and a message (`slo_conversation`);
+        2. Execute the operation `samples` times with 'AsyncQueries.execute_http', `concurrency` of them in flight;
+        3. Assert the `percentile` of the latency distribution is =< `budget_ms` (resources/slo.json).
+
+        """
+        async_query = AsyncQueries()
+        user, params = operation_params(slo.operation, slo_conversation['users'], slo_conversation['conversation_id'],
+                                        slo_conversation['message_id'])
+
+        async def execute():
+            _, elapsed = await async_query.execute_http(endpoint=env_config.graphql_endpoint,
+                                                        user=user,
+                                                        headers=env_config.gql_headers,
+                                                        raw_body=slo.operation,
+                                                        params=params)
+            return elapsed
+        histogram = async_query.run(slo.sample_concurrent(execute))
+        # ---- ASSERTIONS ---- :
+        value = slo.check(histogram)
+        metrics_sink.log(f"[PASSED] SLO {slo}: p{slo.percentile} = {value} ms")
+
+    @mark.slo_ws
+    @mark.parametrize('slo', [s for s in SLOS if s.path == 'ws'], ids=lambda s: s.id)
+    def test_as_a_system_i_want_websocket_operations_to_meet_their_slo(self, slo, env_config, slo_conversation):
+        """
+        TEST CASE:
+        1. Create 2 users dedicated to the SLOs, a conversation and a message (`slo_conversation`);
+        2. Execute the operation `samples` times over the websocket with 'AsyncQueries.execute_async_gql';
+        3. Assert the `percentile` of the latency distribution is =< `budget_ms` (resources/slo.json).
+
+        """
+        async_query = AsyncQueries()
+        user, params = operation_params(slo.operation, slo_conversation['users'], slo_conversation['conversation_id'],
+                                        slo_conversation['message_id'])
+
+        async def graphql_connection():
+            session, = await async_query.create_wss_sessions(env_config.gql_headers, env_config.wss_endpoint, user)
+
+            async def execute():
+                r = await async_query.execute_async_gql(session=session,
+                                                        tag=user['uuid'],
+                                                        raw_body=slo.operation,
+                                                        params=params)
+                return r['elapsed']
+            return await slo.sample_async(execute)
+        histogram = async_query.run(graphql_connection())
+        # ---- ASSERTIONS ---- :
+        value = slo.check(histogram)
+        metrics_sink.log(f"[PASSED] SLO {slo}: p{slo.percentile} = {value} ms")
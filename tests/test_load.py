@@ -0,0 +1,30 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.load import LoadProfile, LoadRunner
+from tests.pool import ws_pool
+
+
+@mark.load
+class LoadTests:
+
+    @mark.load_messaging
+    def test_as_a_system_i_want_to_serve_concurrent_users(self, request, env_config):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--load`):
+        1. Mint `users` virtual users, paired two by two;
+        2. Each pair creates a conversation;
+        3. Every user sends messages, marks the partner's messages as read and sends 'lastSeen' for `duration`;
+        4. Report throughput and latency distribution per operation;
+        5. Assert the error rate is =< `max_error_rate`.
+
+        """
+        profile = LoadProfile.parse(request.config.getoption('--load'))
+        recorder = ws_pool.run(LoadRunner(env_config, profile).run())
+        for line in recorder.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert recorder.total > 0
+        assert recorder.total_errors / recorder.total <= profile.max_error_rate, \
+            f"{recorder.total_errors} of {recorder.total} operations failed: {recorder.errors}"
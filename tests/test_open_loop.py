@@ -0,0 +1,31 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.arrival import ArrivalProfile, OpenLoopScheduler
+from tests.pool import ws_pool
+
+
+@mark.open_loop
+class OpenLoopTests:
+
+    @mark.open_loop_capacity
+    def test_as_a_system_i_want_to_sustain_constant_arrival_rates(self, request, env_config):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--open_loop`):
+        1. Mint `users` virtual users, paired two by two in conversations;
+        2. Fire the operations at their rates on a fixed timetable, whatever the responses;
+        3. Measure the latency from the intended send time of every operation;
+        4. Step the rates up by `step` until the throughput, the p99 or the errors show saturation;
+        5. Report every step and the capacity;
+        6. Assert the rates of the first step are sustained.
+
+        """
+        profile = ArrivalProfile.parse(request.config.getoption('--open_loop'))
+        scheduler = OpenLoopScheduler(env_config, profile).prepare()
+        ws_pool.run(scheduler.run())
+        for line in scheduler.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert scheduler.steps
+        assert scheduler.capacity is not None, f"The first step is saturated: {scheduler.report()[0]}"
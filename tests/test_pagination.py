@@ -0,0 +1,63 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.crawler import PaginationCrawler
+from tests.pool import ws_pool
+
+
+@mark.pagination
+class PaginationTests:
+
+    @mark.crawl_conversations
+    # 'conversationsWith_page' filters the conversations on a participant, given by `user_id`
+    @mark.parametrize('operation, with_participant', [('conversations_page', False), ('conversationsWith_page', True)],
+                      ids=['conversations_page', 'conversationsWith_page'])
+    def test_as_a_participant_i_want_to_page_through_all_my_conversations(self, operation, with_participant, env_config, seed_data):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+        :param seed_data: fetch the users of the seed and the ids of their conversations (`--seed`).
+
+        TEST CASE:
+        1. Seed the conversations of user1 with user2;
+        2. Crawl every page of the conversations of user2 with 'endCursor';
+        3. Report the page latency by page depth;
+        4. Assert every seeded conversation has been returned once.
+
+        """
+        user1, user2 = seed_data['users']
+        crawler = PaginationCrawler(env_config, user2, page_size=10)
+        params = {"tagsFilter": "-", **({"user_id": user1['uuid']} if with_participant else {})}
+
+        async def crawl():
+            return [edge['node']['id'] async for edge in
+                    crawler.crawl(operation, params)]
+        ids = ws_pool.run(crawl())
+        for line in crawler.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert len(ids) == len(set(ids)), "Conversations returned on several pages"
+        assert set(seed_data['conversations']) <= set(ids)
+
+    @mark.crawl_messages
+    def test_as_a_participant_i_want_to_page_through_all_the_messages_of_a_conversation(self, env_config, seed_data):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+        :param seed_data: fetch the users of the seed and the ids of their messages (`--seed`).
+
+        TEST CASE:
+        1. Seed the messages of a conversation of user1 with user2;
+        2. Crawl every page of its messages with 'endCursor';
+        3. Assert every seeded message has been returned once, in the order they were sent.
+
+        """
+        user1, _ = seed_data['users']
+        conversation_id = seed_data['conversations'][0]
+        crawler = PaginationCrawler(env_config, user1, page_size=3)
+
+        async def crawl():
+            return [edge['node']['id'] async for edge in
+                    crawler.crawl('messagesByConversation_page', {"conversation_id": conversation_id})]
+        ids = ws_pool.run(crawl())
+        for line in crawler.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert ids == seed_data['messages'][conversation_id]
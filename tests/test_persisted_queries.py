@@ -0,0 +1,40 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.persisted import PersistedQueryBenchmark
+
+
+@mark.persisted_queries
+class PersistedQueryTests:
+
+    @mark.apq_benchmark
+    def test_as_a_mobile_client_i_want_persisted_queries_to_shrink_my_requests(self, env_config, create_users,
+                                                                               create_conversation, send_text_message):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+        :param create_users: fetch auth data and uuid of the users.
+        :param create_conversation: fetch conversation_id.
+
+        TEST CASE:
+        1. Create 2 users, a conversation and a message;
+        2. Execute each read query with its full text and as an automatic persisted query (sha256 hash), interleaved;
+        3. Report the request size and the latency medians of both modes;
+        4. Assert both modes return the same responses, persisted queries are registered once and the requests are
+           smaller overall (the hash envelope outweighs the text of tiny documents such as 'userMeta').
+
+        """
+        user1, _ = create_users
+        conversation_id = create_conversation['createConversation']['conversation']['id']
+        operations = {
+            'conversations': {"tagsFilter": "-"},
+            'messagesByConversation': {"conversation_id": conversation_id},
+            'unreadMessages': {"conversation_id": conversation_id},
+            'userMeta': None,
+        }
+        benchmark = PersistedQueryBenchmark(env_config, user1, operations).run()
+        for line in benchmark.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert not benchmark.mismatches, f"Different responses with persisted queries: {benchmark.mismatches}"
+        assert not benchmark.misses, f"Persisted queries registered more than once: {benchmark.misses}"
+        assert sum(benchmark.medians(operation, 'apq')['request'] for operation in operations) < \
+            sum(benchmark.medians(operation, 'full')['request'] for operation in operations)
@@ -0,0 +1,29 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.cassette import load_cassette
+from tests.replay import TrafficReplay
+
+
+@mark.replay
+class TrafficReplayTests:
+
+    @mark.replay_latency
+    def test_as_a_system_i_want_to_serve_recorded_traffic_as_fast_as_before(self, request, env_config):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--replay_traffic`):
+        1. Load the cassette recorded with `--record`;
+        2. Replay its HTTP operations against the environment, with the `--pacing` pacing;
+        3. Report the recorded and replayed latency medians per operation;
+        4. Assert no operation got slower than `--regression_threshold` (one-sided Mann-Whitney U test).
+
+        """
+        replay = TrafficReplay(env_config, load_cassette(request.config.getoption('--replay_traffic')),
+                               pacing=request.config.getoption('--pacing'),
+                               threshold=request.config.getoption('--regression_threshold')).run()
+        for line in replay.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert replay.replayed.total > 0
+        assert not replay.regressions, f"Slower than recorded: {replay.regressions}"
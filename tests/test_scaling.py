@@ -0,0 +1,28 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.scaling import ScalingProfile, ScalingBenchmark
+
+
+@mark.scaling
+class DataVolumeScalingTests:
+
+    @mark.scaling_reads
+    def test_as_a_heavy_user_i_want_read_queries_to_scale_with_my_data(self, request, env_config):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--scaling`):
+        1. Mint 2 users;
+        2. Grow their conversations, tagged conversations and unread messages to each of `sizes`;
+        3. At each size, execute every read query `samples` times and keep its median latency;
+        4. Fit the complexity class of each read query over the sizes and report its curve;
+        5. Assert no read query grows superlinearly with the data volume.
+
+        """
+        profile = ScalingProfile.parse(request.config.getoption('--scaling'))
+        benchmark = ScalingBenchmark(env_config, profile).run()
+        for line in benchmark.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert benchmark.medians
+        assert not benchmark.superlinear, f"Superlinear read queries: {benchmark.superlinear}"
@@ -0,0 +1,31 @@
+# ruff: noqa: E501
+from pytest import mark
+from tests.soak import SoakProfile, SoakRunner
+from tests.pool import ws_pool
+
+
+@mark.soak
+class SoakTests:
+
+    @mark.soak_messaging
+    def test_as_a_system_i_want_to_serve_users_for_hours_without_degrading(self, request, env_config):
+        """
+        :param env_config: fetch the environment configs: graphql_endpoint, domain, ect.
+
+        TEST CASE (runs only with `--soak`):
+        1. Mint `users` virtual users, paired two by two in conversations;
+        2. Every user holds 'userOnline' and 'messageRead' subscriptions, sends 'lastSeen' heartbeats,
+           sends messages and marks the partner's messages as read for `duration`;
+        3. Every `window`, snapshot the latency percentiles, reconnections, dropped events, memory and file descriptors;
+        4. Assert no event has been dropped, no p95 drifts upward by more than `drift` and no file descriptor leaks.
+
+        """
+        profile = SoakProfile.parse(request.config.getoption('--soak'))
+        runner = ws_pool.run(SoakRunner(env_config, profile).run())
+        for line in runner.report():
+            print(line)
+        # ---- ASSERTIONS ---- :
+        assert runner.windows
+        assert not runner.dropped, f"{runner.dropped} subscription events dropped"
+        assert not runner.drifts, f"Latency drifting upward: {runner.drifts}"
+        assert not runner.leaks, f"Client resources leaking: {runner.leaks}"
@@ -4,6 +4,7 @@ import backoff
 from pytest import mark, fail
 from datetime import datetime, timedelta
 from tests.queries import Queries, AsyncQueries
+from tests.sink import metrics_sink
 
 
 @mark.user_presence
@@ -28,9 +29,9 @@ class UserPresenceTests:
         # ---- ASSERTIONS ---- :
         assert result[event_name]['success']
         assert elapsed <= env_config.time_assert
-        print(
+        metrics_sink.log(
             f"[PASSED] User '{user1['uuid']}' lastSeen:{result[event_name]['success']}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.user_online
     def test_as_a_logged_in_user_i_want_to_know_when_another_user_has_an_update_on_their_presence(self, env_config, create_users, create_conversation):
@@ -50,37 +51,38 @@ class UserPresenceTests:
 
         @backoff.on_exception(backoff.expo, Exception, max_time=5)
         async def graphql_connection():
-            user1_client, user2_client = async_query.create_wss_clients(
-                headers=env_config.gql_headers,
-                wss_endpoint=env_config.wss_endpoint,
-                user1_auth=f"{user1['jwt_token']}",
-                user2_auth=f"{user2['jwt_token']}")
-            async with user1_client as user1_session, user2_client as user2_session:
-                task1 = asyncio.create_task(
-                    async_query.execute_subscription(
-                        session=user1_session,
-                        tag='user1',
-                        raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
-                        n_events=1,
-                        params={"conversation_id": [conversation_id]}))
-                task2 = asyncio.create_task(
-                    async_query.execute_async_gql(
-                        session=user2_session,
-                        tag='user2',
-                        raw_body='resources/gql_payload/mutations/lastSeen.graphql'))
-                try:
-                    r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
-                except asyncio.TimeoutError:
-                    fail("Subscription got no events!")
+            user1_session, user2_session = await async_query.create_wss_sessions(
+                env_config.gql_headers, env_config.wss_endpoint, user1, user2)
+            ready = asyncio.Event()
+            task1 = asyncio.create_task(
+                async_query.execute_subscription(
+                    session=user1_session,
+                    tag='user1',
+                    raw_body=f'resources/gql_payload/subscriptions/{event_name}.graphql',
+                    n_events=1,
+                    params={"conversation_id": [conversation_id]},
+                    ready=ready))
+            task2 = asyncio.create_task(
+                async_query.execute_async_gql(
+                    session=user2_session,
+                    tag='user2',
+                    raw_body='resources/gql_payload/mutations/lastSeen.graphql',
+                    ready=ready,
+                    correlation_key=user2['uuid']))
+            try:
+                r = await asyncio.wait_for(asyncio.gather(task1, task2), timeout=60)
+            except asyncio.TimeoutError:
+                fail("Subscription got no events!")
             return r[0], r[1]
-        r_task1, r_task2 = asyncio.run(graphql_connection())
+        r_task1, r_task2 = async_query.run(graphql_connection())
         # ---- ASSERTIONS ---- :
         assert r_task1['response'][0][event_name]['user']['apiId'] == user2['uuid']
         assert r_task1['response'][0][event_name]['user']['isOnline']
         assert r_task2['response']['lastSeen']['success']
-        assert r_task1['elapsed'] <= env_config.time_assert
-        print(f"[INFO] 'userOnline' elapsed time: {r_task1['elapsed']} ms")
-        print(f"[INFO] 'lastSeen' elapsed time: {r_task2['elapsed']} ms")
+        assert r_task1['latency'][0] is not None, "'userOnline' event not correlated with its trigger"
+        assert r_task1['latency'][0] <= env_config.time_assert
+        metrics_sink.log(f"[INFO] 'userOnline' delivery latency: {r_task1['latency'][0]} ms")
+        metrics_sink.log(f"[INFO] 'lastSeen' elapsed time: {r_task2['elapsed']} ms")
 
     @mark.user_meta
     def test_as_a_logged_in_user_i_want_to_get_user_meta(self, env_config, create_users):
@@ -102,8 +104,8 @@ class UserPresenceTests:
         assert isinstance(result[event_name]['unreadCount'], int)
         assert result[event_name]['user']['apiId'] == user1['uuid']
         assert elapsed <= env_config.time_assert
-        print(f"[PASSED] User '{user1['uuid']}' meta:{result[event_name]}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[PASSED] User '{user1['uuid']}' meta:{result[event_name]}")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
 
     @mark.participants_with_unread_messages
     def test_as_system_i_want_to_get_a_list_of_users_with_unread_messages(self, env_config, create_users):
@@ -123,6 +125,6 @@ class UserPresenceTests:
         assert result[event_name]['edges'][0]['node']['id']
         assert result[event_name]['edges'][0]['node']['user']['apiId']
         assert elapsed <= env_config.time_assert
-        print(
+        metrics_sink.log(
             f"[PASSED] Participants with unread messages {result[event_name]}")
-        print(f"[INFO] Elapsed time: {elapsed} ms")
+        metrics_sink.log(f"[INFO] Elapsed time: {elapsed} ms")
@@ -0,0 +1,385 @@
+# ruff: noqa: E501
+import json
+import hashlib
+import socket
+import zlib
+import requests
+from contextvars import ContextVar
+from timeit import default_timer as timer
+from aiohttp import ClientResponseError
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from graphql import ExecutionResult, print_ast
+from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.requests import RequestsHTTPTransport
+from gql.transport.exceptions import TransportClosed, TransportProtocolError, TransportServerError
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # the standard decoder, slower on large responses
+    json_loads = json.loads
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # 'br' is not negotiated without them (Config)
+        brotli = None
+
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'download', 'decode', 'process')
+CONNECTION_PHASES = ('dns', 'connect', 'tls')
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+# timing of the operation executed by the current asyncio task on a TimedAIOHTTPTransport (see `capture_timing`)
+_operation_timing = ContextVar('operation_timing', default=None)
+
+
+class _TimedConnectionMixin:
+    """Measures DNS resolution, TCP connect and TLS handshake of a new connection; reused connections report zeros."""
+
+    phases = None
+
+    def _new_conn(self):
+        start = timer()
+        host = self._dns_host
+        try:
+            resolved = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror:
+            resolved = host
+        resolved_at = timer()
+        self._dns_host = resolved
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        self.phases = {'dns': resolved_at - start, 'connect': timer() - resolved_at, 'tls': 0.0}
+        return sock
+
+    def connect(self):
+        start = timer()
+        super().connect()
+        self.phases['tls'] = max(0.0, timer() - start - self.phases['dns'] - self.phases['connect'])
+
+    def pop_phases(self):
+        phases = self.phases or dict.fromkeys(CONNECTION_PHASES, 0.0)
+        self.phases = None
+        return phases
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+
+def parse_server_timing(header):
+    """`Server-Timing: db;dur=53, app;dur=47.2` -> {'db': 53.0, 'app': 47.2}"""
+    timings = {}
+    for metric in filter(None, (m.strip() for m in (header or '').split(','))):
+        name, *params = [p.strip() for p in metric.split(';')]
+        for param in params:
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                try:
+                    timings[name] = float(value.strip('"'))
+                except ValueError:
+                    pass
+    return timings
+
+
+def extensions_timing(extensions):
+    """Server-side timing sent in the GraphQL `extensions` (Apollo tracing or a `timing(s)` map), in ms."""
+    if not extensions:
+        return {}
+    timings = {}
+    tracing = extensions.get('tracing')
+    if isinstance(tracing, dict) and 'duration' in tracing:
+        timings['tracing'] = tracing['duration'] / 1e6
+    for key in ('timing', 'timings'):
+        if isinstance(extensions.get(key), dict):
+            timings.update({k: v for k, v in extensions[key].items() if isinstance(v, (int, float))})
+    return timings
+
+
+_persisted_queries = {}
+
+
+def persisted_query(document):
+    """Printed text of `document` and its sha256 hash (hex), computed once per document."""
+    if id(document) not in _persisted_queries:
+        query = print_ast(document)
+        # the document is kept with its hash so that its id is not reused by another one
+        _persisted_queries[id(document)] = (document, query, hashlib.sha256(query.encode()).hexdigest())
+    return _persisted_queries[id(document)][1:]
+
+
+class TimedRequestsHTTPTransport(RequestsHTTPTransport):
+    """
+    RequestsHTTPTransport that records the timing of the last request by phase, in ms.
+
+    ttfb is the time between sending the request on an open connection and receiving the
+    response headers, download the time to read the body and decode the JSON parsing.
+    The phases of the server (`Server-Timing` header, `extensions` timing) are kept next to it,
+    with the size of the request body and of the response body on the wire and decompressed.
+
+    With `persisted_queries` the documents are sent as automatic persisted queries: their sha256
+    hash only, and their text once more when the server answers 'PersistedQueryNotFound'.
+    """
+
+    last_timing = None
+
+    def __init__(self, *args, persisted_queries=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.persisted_queries = persisted_queries
+
+    def connect(self):
+        super().connect()
+        adapter = TimedHTTPAdapter(max_retries=self.retries)
+        for prefix in "http://", "https://":
+            self.session.mount(prefix, adapter)
+
+    def execute(self, document, variable_values=None, operation_name=None, timeout=None):
+        if not self.session:
+            raise TransportClosed("Transport is not connected")
+        payload = {}
+        if variable_values:
+            payload["variables"] = variable_values
+        if operation_name:
+            payload["operationName"] = operation_name
+        if not self.persisted_queries:
+            result, self.last_timing = self._post({"query": print_ast(document), **payload}, timeout)
+            return result
+        query, query_hash = persisted_query(document)
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+        result, timing = self._post({**payload, "extensions": extensions}, timeout)
+        timing['persisted_query'] = 'hit'
+        if any(e.get('message') == PERSISTED_QUERY_NOT_FOUND for e in result.errors or []):
+            # first execution of the document on this server: register its text under the hash
+            result, registration = self._post({"query": query, **payload, "extensions": extensions}, timeout)
+            for phase, value in registration['phases'].items():
+                timing['phases'][phase] = round(timing['phases'][phase] + value, 3)
+            for key in ('request', 'wire', 'decoded'):
+                timing['bytes'][key] += registration['bytes'][key]
+            timing['server'] = registration['server']
+            timing['persisted_query'] = 'miss'
+        self.last_timing = timing
+        return result
+
+    def _post(self, payload, timeout):
+        data_key = "json" if self.use_json else "data"
+        post_args = {
+            "headers": self.headers,
+            "auth": self.auth,
+            "cookies": self.cookies,
+            "timeout": timeout or self.default_timeout,
+            "verify": self.verify,
+            "stream": True,
+            data_key: payload,
+        }
+        post_args.update(self.kwargs)
+
+        start = timer()
+        response = self.session.request(self.method, self.url, **post_args)
+        headers_at = timer()
+        connection = response.raw.connection
+        phases = connection.pop_phases() if isinstance(connection, _TimedConnectionMixin) \
+            else dict.fromkeys(CONNECTION_PHASES, 0.0)
+        body = response.content
+        downloaded_at = timer()
+        try:
+            result = json_loads(body)
+        except ValueError:
+            self._raise_response_error(response, "Not a JSON answer")
+        decoded_at = timer()
+        if "errors" not in result and "data" not in result:
+            self._raise_response_error(response, 'No "data" or "errors" keys in answer')
+
+        phases['ttfb'] = max(0.0, headers_at - start - sum(phases.values()))
+        phases['download'] = downloaded_at - headers_at
+        phases['decode'] = decoded_at - downloaded_at
+        timing = {
+            'phases': {phase: round(value * 1000, 3) for phase, value in phases.items()},
+            'server': {**parse_server_timing(response.headers.get('Server-Timing')),
+                       **extensions_timing(result.get('extensions'))},
+            'bytes': {'request': len(response.request.body or b''),
+                      'wire': response.raw.tell() or len(body),
+                      'decoded': len(body),
+                      'encoding': response.headers.get('Content-Encoding', 'identity')},
+        }
+        return ExecutionResult(errors=result.get("errors"), data=result.get("data"),
+                               extensions=result.get("extensions")), timing
+
+    @staticmethod
+    def _raise_response_error(response, reason):
+        # as RequestsHTTPTransport: TransportServerError for a 4xx/5xx status, TransportProtocolError otherwise
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise TransportServerError(str(e), response.status_code) from e
+        raise TransportProtocolError(f"Server did not return a GraphQL result: {reason}: {response.text}")
+
+
+def capture_timing():
+    """
+    Dict filled with the timing of the next operation the current asyncio task executes on a
+    `TimedAIOHTTPTransport`: the transport is shared by the concurrent tasks of its user, so the timing
+    cannot be kept on it as `TimedRequestsHTTPTransport.last_timing` is.
+    """
+    timing = {}
+    _operation_timing.set(timing)
+    return timing
+
+
+def decompress(body, encoding):
+    """Body of a response received with `auto_decompress=False`, decoded from its 'Content-Encoding'."""
+    if encoding in ('gzip', 'deflate'):
+        # gzip or zlib header, detected
+        return zlib.decompress(body, 47)
+    if encoding == 'br':
+        return brotli.decompress(body)
+    return body
+
+
+class TimedAIOHTTPTransport(AIOHTTPTransport):
+    """
+    AIOHTTPTransport that records the timing of each operation as `TimedRequestsHTTPTransport` does:
+    ttfb, download and decode phases (the connections are pooled, their setup is not measured),
+    the `Server-Timing` and `extensions` timing and the size of the request body and of the response
+    body on the wire and decompressed. The responses are decompressed by the transport, so that their
+    size on the wire is known: the aiohttp session must be created with `auto_decompress=False`.
+
+    With `persisted_queries` the documents are sent as automatic persisted queries.
+    """
+
+    def __init__(self, *args, persisted_queries=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.persisted_queries = persisted_queries
+
+    async def execute(self, document, variable_values=None, operation_name=None, extra_args=None, upload_files=False):
+        if self.session is None:
+            raise TransportClosed("Transport is not connected")
+        payload = {}
+        if variable_values:
+            payload["variables"] = variable_values
+        if operation_name:
+            payload["operationName"] = operation_name
+        if not self.persisted_queries:
+            result, timing = await self._post({"query": print_ast(document), **payload}, extra_args)
+        else:
+            query, query_hash = persisted_query(document)
+            extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+            result, timing = await self._post({**payload, "extensions": extensions}, extra_args)
+            timing['persisted_query'] = 'hit'
+            if any(e.get('message') == PERSISTED_QUERY_NOT_FOUND for e in result.errors or []):
+                # first execution of the document on this server: register its text under the hash
+                result, registration = await self._post({"query": query, **payload, "extensions": extensions}, extra_args)
+                for phase, value in registration['phases'].items():
+                    timing['phases'][phase] = round(timing['phases'][phase] + value, 3)
+                for key in ('request', 'wire', 'decoded'):
+                    timing['bytes'][key] += registration['bytes'][key]
+                timing['server'] = registration['server']
+                timing['persisted_query'] = 'miss'
+        captured = _operation_timing.get()
+        if captured is not None:
+            captured.update(timing)
+        return result
+
+    async def _post(self, payload, extra_args):
+        data = json.dumps(payload).encode()
+        post_args = {'data': data, 'headers': {'Content-Type': 'application/json'}, **(extra_args or {})}
+        start = timer()
+        async with self.session.post(self.url, ssl=self.ssl, **post_args) as response:
+            headers_at = timer()
+            wire = await response.read()
+            downloaded_at = timer()
+            encoding = response.headers.get('Content-Encoding', 'identity')
+            body = decompress(wire, encoding)
+            try:
+                result = json_loads(body)
+            except ValueError:
+                await self._raise_response_error(response, body, "Not a JSON answer")
+            decoded_at = timer()
+            if "errors" not in result and "data" not in result:
+                await self._raise_response_error(response, body, 'No "data" or "errors" keys in answer')
+            timing = {
+                'phases': {'ttfb': round((headers_at - start) * 1000, 3),
+                           'download': round((downloaded_at - headers_at) * 1000, 3),
+                           'decode': round((decoded_at - downloaded_at) * 1000, 3)},
+                'server': {**parse_server_timing(response.headers.get('Server-Timing')),
+                           **extensions_timing(result.get('extensions'))},
+                'bytes': {'request': len(data), 'wire': len(wire), 'decoded': len(body), 'encoding': encoding},
+            }
+        return ExecutionResult(errors=result.get("errors"), data=result.get("data"),
+                               extensions=result.get("extensions")), timing
+
+    @staticmethod
+    async def _raise_response_error(response, body, reason):
+        # as AIOHTTPTransport: TransportServerError for a 4xx/5xx status, TransportProtocolError otherwise
+        try:
+            response.raise_for_status()
+        except ClientResponseError as e:
+            raise TransportServerError(str(e), e.status) from e
+        raise TransportProtocolError(f"Server did not return a GraphQL result: {reason}: {body.decode(errors='replace')}")
+
+
+class RequestTimings:
+    """
+    Phase breakdowns of the operations executed by the current test, attached to its report, and
+    payload sizes per operation over the whole session.
+    """
+
+    def __init__(self):
+        self.current = []
+        self.sizes = {}
+
+    def reset(self):
+        self.current = []
+
+    def add(self, operation, timing):
+        self.current.append({'operation': operation, **timing})
+        sizes = self.sizes.setdefault(operation, {'count': 0, 'request': 0, 'wire': 0, 'decoded': 0, 'decode': 0.0})
+        sizes['count'] += 1
+        sizes['decode'] += timing['phases'].get('decode', 0.0)
+        for key in ('request', 'wire', 'decoded'):
+            sizes[key] += timing['bytes'][key]
+
+    def section(self):
+        lines = [f"{'operation':<32}" + "".join(f"{phase:>10}" for phase in PHASES) + "  server, bytes request/wire/decoded"]
+        for t in self.current:
+            server = ", ".join(f"{k}: {v} ms" for k, v in t['server'].items()) or '-'
+            size = t['bytes']
+            lines.append(f"{t['operation']:<32}" + "".join(f"{t['phases'].get(phase, 0.0):>10.1f}" for phase in PHASES)
+                         + f"  {server}, {size['request']}/{size['wire']}/{size['decoded']} ({size['encoding']})")
+        return "\n".join(lines)
+
+    def summary(self):
+        """Average payload sizes per operation, the largest responses first."""
+        lines = []
+        for operation, s in sorted(self.sizes.items(), key=lambda item: -item[1]['decoded'] / item[1]['count']):
+            n = s['count']
+            lines.append(f"[INFO] '{operation}': {n} requests, avg request {round(s['request'] / n)} B, response "
+                         f"{round(s['wire'] / n)} B on the wire / {round(s['decoded'] / n)} B decoded "
+                         f"({round(s['wire'] / max(s['decoded'], 1) * 100)}%), decode {round(s['decode'] / n, 3)} ms")
+        return lines
+
+
+request_timings = RequestTimings()
@@ -0,0 +1,31 @@
+import os
+import jwt
+from uuid import uuid4
+from datetime import datetime, timedelta
+
+
+def worker_id():
+    """Name of the pytest-xdist worker running this process ('gw0', 'gw1', ...), 'main' without xdist."""
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+def worker_path(path, worker=None):
+    """File `path` of a pytest-xdist worker, this one by default: 'run.jsonl.gz' -> 'run.gw0.jsonl.gz'."""
+    worker = worker or worker_id()
+    if worker == 'main':
+        return path
+    directory, name = os.path.split(path)
+    stem, _, ext = name.partition('.')
+    return os.path.join(directory, f"{stem}.{worker}.{ext}" if ext else f"{stem}.{worker}")
+
+
+def mint_user(jwt_key, prefix='user-conspector', ttl=timedelta(minutes=30), uuid=None):
+    # the random suffix keeps users minted at the same microsecond by parallel workers apart
+    uuid = uuid or f"{prefix}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{worker_id()}-{uuid4().hex[:8]}"
+    jwt_token = jwt.encode({"id": uuid, "super_admin": True, "iat": datetime.utcnow(),
+                            "exp": datetime.utcnow() + ttl},
+                           jwt_key, algorithm="HS256")
+    return {
+        'uuid': uuid,
+        'jwt_token': jwt_token
+    }